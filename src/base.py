@@ -47,7 +47,8 @@ class CommandExecutor(ABC):
     pass
 
   def execute(self, command, device):
-    assert device is not None, "device cannot be None"
+    if device is None:
+      raise TypeError("device cannot be None")
     for sig in [signal.SIGINT, signal.SIGTERM]:
       signal.signal(sig, lambda s, f: self.signal_handler(s, f))
     device.root_device()
@@ -23,12 +23,14 @@ from .handle_input import HandleInput
 from .profiler import verify_trigger_args
 from .utils import run_subprocess, TEXTPROTO_FILE_EXTENSIONS
 
+PREDEFINED_CONFIG_NAMES = tuple(PREDEFINED_PERFETTO_CONFIGS)
+
 
 def add_config_parser(subparsers):
   common_config_args = argparse.ArgumentParser(add_help=False)
   common_config_args.add_argument(
       'config_name',
-      choices=['lightweight', 'default', 'memory'],
+      choices=PREDEFINED_CONFIG_NAMES,
       help='Name of the predefined config to copy')
 
   common_profiler_args = create_common_config_parser()
@@ -162,7 +164,7 @@ def execute_config_command(args, device):
   command = create_config_command(args)
   match command.get_type():
     case "config list":
-      print("\n".join(list(PREDEFINED_PERFETTO_CONFIGS.keys())))
+      print("\n".join(PREDEFINED_PERFETTO_CONFIGS))
       return None
     case "config show" | "config pull":
       return execute_show_or_pull_command(command, device)
@@ -18,6 +18,13 @@ import argparse
 import textwrap
 from .base import ANDROID_SDK_VERSION_T, ValidationError
 
+# Configs are built as shell heredocs for commands that run them through a
+# shell.
+HEREDOC_START = "<<EOF"
+HEREDOC_END = "EOF"
+TRIGGER_MODES = ("stop", "start", "clone", "STOP_TRACING", "START_TRACING",
+                 "CLONE_SNAPSHOT")
+
 
 def create_ftrace_events_string(predefined_ftrace_events,
                                 excluded_ftrace_events, included_ftrace_events):
@@ -95,10 +102,7 @@ def create_common_config_parser():
       ' them all.')
   common_config_args.add_argument(
       '--trigger-mode',
-      choices=[
-          'stop', 'start', 'clone', 'STOP_TRACING', 'START_TRACING',
-          'CLONE_SNAPSHOT'
-      ],
+      choices=TRIGGER_MODES,
       help='Specifies the trigger config mode. stop'
       ' will stop tracing when a trigger is'
       ' received. start will start tracing when a'
@@ -384,7 +388,7 @@ def build_predefined_config(command,
     }}'''
 
   config = f'''\
-    <<EOF
+    {HEREDOC_START}
     {buffers}
     {linux_process_stats.lstrip()}
     {android_logs.lstrip()}
@@ -399,7 +403,7 @@ def build_predefined_config(command,
     {incremental_state.lstrip()}
     {trigger_config.lstrip()}
 
-    EOF'''
+    {HEREDOC_END}'''
   return textwrap.dedent(config), None
 
 
@@ -560,6 +564,14 @@ PREDEFINED_PERFETTO_CONFIGS = {
 }
 
 
+def strip_heredoc(config):
+  """
+  Returns the text of a config built as a shell heredoc, for commands that
+  read it from stdin instead.
+  """
+  return config.strip().removeprefix(HEREDOC_START).removesuffix(HEREDOC_END)
+
+
 def build_custom_config(command):
   file_content = ""
   duration_prefix = "duration_ms:"
@@ -586,5 +598,6 @@ def build_custom_config(command):
     return None, ValidationError(
         ("Failed to parse custom perfetto-config on"
          " local file path: %s. %s" % (command.perfetto_config, str(e))), None)
-  config_string = f"<<EOF\n\n{file_content}\n{appended_duration}\n\nEOF"
+  config_string = (f"{HEREDOC_START}\n\n{file_content}\n{appended_duration}"
+                   f"\n\n{HEREDOC_END}")
   return config_string, None
@@ -15,18 +15,58 @@
 #
 
 import enum
-import math
 import os
+import re
+import shlex
+import subprocess
 import sys
 import time
 from abc import ABC, abstractmethod
+from functools import cached_property
 from .base import ValidationError
 from .handle_input import HandleInput
 from .shell import AdbShell
-from .utils import poll_is_task_completed, POLLING_INTERVAL_SECS, run_subprocess, ShellExitCodes
+from .utils import POLLING_INTERVAL_SECS, run_subprocess, ShellExitCodes
 
 BOOT_COMPLETED_TIME_OUT_SECS = 30
+# Time for the device to go away after adbd restarts or the device reboots.
+WAIT_FOR_DISCONNECT_TIME_OUT_SECS = 5
+# Printed by 'adb root' when adbd doesn't need to restart.
+ADB_ALREADY_ROOT_OUTPUT = b"adbd is already running as root"
+# Polls sys.boot_completed on the device so that waiting for boot takes a
+# single adb call. Exits with 0 once boot completes, 1 on time out.
+WAIT_FOR_BOOT_COMPLETED_SCRIPT = (
+    "i=0; while [ \"$(getprop sys.boot_completed)\" != 1 ] &&"
+    " [ $i -lt %d ]; do sleep %s; i=$((i+1)); done;"
+    " [ \"$(getprop sys.boot_completed)\" = 1 ]" %
+    (BOOT_COMPLETED_TIME_OUT_SECS / POLLING_INTERVAL_SECS,
+     POLLING_INTERVAL_SECS))
+PERFETTO_TRACE_FILE = "/data/misc/perfetto-traces/trace.perfetto-trace"
 SIMPLEPERF_TRACE_FILE = "/tmp/simpleperf-traces/perf.data"
+# Events in 'simpleperf list' are indented by two spaces. Any event with a
+# space will have the event before the first space.
+SIMPLEPERF_EVENT_RE = re.compile(r"(?m)^  ([^ #\n][^ \n]*)")
+# Matches the user ID in each 'UserInfo{<id>:<name>:<flags>}' line of
+# 'pm list users'.
+USER_ID_RE = re.compile(rb"\{(\d+):")
+PACKAGE_PREFIX = b"package:"
+# 'am' is a wrapper script around 'cmd activity', so call the latter directly
+# and only fall back to 'am' on devices without it.
+GET_CURRENT_USER_COMMAND = ("cmd activity get-current-user 2>/dev/null ||"
+                            " am get-current-user")
+# Lists the users and prints the current user after a separator line, so
+# that both are read in a single round trip.
+USER_INFO_SEPARATOR = b"__TORQ_CURRENT_USER__\n"
+GET_USER_INFO_SCRIPT = (
+    "pm list users && echo %s && { %s; }" %
+    (USER_INFO_SEPARATOR.decode("utf-8").strip(), GET_CURRENT_USER_COMMAND))
+# Removes the file named by $0 and every file whose name starts with it. Only
+# the suffix is expanded, so $0 is never split or matched as a pattern.
+REMOVE_WITH_SUFFIXES_SCRIPT = "rm -f -- \"$0\"*"
+# Looks up and kills the process named by $0 in one adb call; a process that
+# is not running is not an error.
+KILL_PROCESS_SCRIPT = ("pids=$(pidof \"$0\");"
+                       " [ -z \"$pids\" ] || kill -9 $pids")
 
 
 def get_device(serial, is_device_required):
@@ -35,11 +75,11 @@ def get_device(serial, is_device_required):
     error = AdbShell.verify_serial(serial)
     if error is not None:
       return None, error
-    device = AndroidDevice(AdbShell(serial))
+    device = AndroidDevice(AdbShell(serial, persistent=True))
   else:
     serial, error = AdbShell.get_default_serial()
     if error is None:
-      device = AndroidDevice(AdbShell(serial))
+      device = AndroidDevice(AdbShell(serial, persistent=True))
     elif is_device_required:
       return None, error
   return device, None
@@ -57,7 +97,8 @@ class Device(ABC):
   """
 
   def __init__(self, shell):
-    assert shell is not None, "shell cannot be None"
+    if shell is None:
+      raise TypeError("shell cannot be None")
     self.shell = shell
 
   @abstractmethod
@@ -88,6 +129,10 @@ class Device(ABC):
   def remove_file(self, filepath):
     raise NotImplementedError
 
+  @abstractmethod
+  def ensure_removed(self, filepath, with_suffixes=False):
+    raise NotImplementedError
+
   @abstractmethod
   def is_process_running(self, process_name):
     raise NotImplementedError
@@ -100,6 +145,9 @@ class Device(ABC):
   def start_perfetto_trace(self, config):
     raise NotImplementedError
 
+  def close(self):
+    self.shell.close()
+
 
 class AndroidDevice(Device):
   """
@@ -107,6 +155,10 @@ class AndroidDevice(Device):
   the adb bridge.
   """
 
+  def __init__(self, shell):
+    super().__init__(shell)
+    self.simpleperf_events = None
+
   def id(self):
     return self.shell.id()
 
@@ -114,36 +166,64 @@ class AndroidDevice(Device):
     return OSCodes.OS_ANDROID
 
   def root_device(self):
-    self.shell.run(["root"])
-    if not self.shell.wait_for_device():
+    # Restarting adbd as root drops any open shell session.
+    self.shell.close()
+    self.invalidate()
+    output = self.shell.run(["root"], capture_output=True)
+    # The device may still be listed right after 'adb root' returns, so wait
+    # for adbd to go away before waiting for it to come back. adbd can also
+    # restart before the first check, so a missed disconnect is not an error.
+    if ADB_ALREADY_ROOT_OUTPUT not in output.stdout:
+      self.shell.wait_for_disconnect(WAIT_FOR_DISCONNECT_TIME_OUT_SECS)
+    if not self.shell.wait_for_device(BOOT_COMPLETED_TIME_OUT_SECS):
       raise Exception(("Device with serial %s took too long to reconnect after"
                        " being rooted." % self.shell.id()))
 
   def remove_file(self, filepath):
-    output = self.shell.run(["shell", "rm", filepath],
-                            capture_output=True,
-                            ignore_returncodes=[ShellExitCodes.EX_FAILURE])
+    """
+    Removes filepath, a literal path rather than a glob pattern, and returns
+    whether it existed. Discouraged for new callers: use ensure_removed,
+    which also succeeds when the file doesn't exist.
+    """
+    output = self.shell.shell_exec(
+        ["rm", filepath], ignore_returncodes=[ShellExitCodes.EX_FAILURE])
+    return not output.returncode
+
+  def ensure_removed(self, filepath, with_suffixes=False):
+    """
+    Removes filepath if it exists, along with every file whose name starts
+    with it if with_suffixes is set, and returns whether rm succeeded. This
+    replaces checking file_exists before remove_file, taking a single command.
+    """
+    output = self.shell.shell_exec(
+        ["sh", "-c", REMOVE_WITH_SUFFIXES_SCRIPT, filepath]
+        if with_suffixes else ["rm", "-f", "--", filepath],
+        ignore_returncodes=[ShellExitCodes.EX_FAILURE])
     return not output.returncode
 
   def file_exists(self, file):
-    output = self.shell.run(["shell", "ls", file],
-                            capture_output=True,
-                            ignore_returncodes=[ShellExitCodes.EX_FAILURE])
+    """
+    Returns whether file exists. Discouraged as a check before remove_file:
+    use ensure_removed instead.
+    """
+    output = self.shell.shell_exec(
+        ["ls", file], ignore_returncodes=[ShellExitCodes.EX_FAILURE])
     return not output.returncode
 
   def start_perfetto_trace(self, config):
-    return self.shell.popen("shell perfetto -c - --txt -o "
-                            "/data/misc/perfetto-traces/trace.perfetto-trace " +
-                            config)
+    return self.shell.popen_with_stdin(
+        ["shell", "perfetto", "-c", "-", "--txt", "-o", PERFETTO_TRACE_FILE],
+        config.encode("utf-8"))
 
   def trigger_perfetto(self, trigger_name):
-    self.shell.run(["shell", "trigger_perfetto", trigger_name])
+    self.shell.run(["shell", "trigger_perfetto", trigger_name],
+                   stdout=subprocess.DEVNULL)
 
   def start_simpleperf_trace(self, command):
     events_param = "-e " + ",".join(command.simpleperf_event)
     duration = ""
     if command.dur_ms is not None:
-      duration = "--duration %d" % int(math.ceil(command.dur_ms / 1000))
+      duration = "--duration %d" % ((command.dur_ms + 999) // 1000)
     return self.shell.popen([
         "shell", "simpleperf", "record", "-a", "-f", "1000", "--exclude-perf",
         "--post-unwind=yes", "-m", "8192", "-g", duration, events_param, "-o",
@@ -156,16 +236,30 @@ class AndroidDevice(Device):
                             ignore_returncodes=[ShellExitCodes.EX_FAILURE])
     return not output.returncode
 
-  def get_all_users(self):
-    command_output = self.shell.run(["shell", "pm", "list", "users"],
-                                    capture_output=True)
-    output_lines = command_output.stdout.decode("utf-8").split("\n")[1:-1]
-    return [
-        int((line.split("{", 1)[1]).split(":", 1)[0]) for line in output_lines
-    ]
+  @staticmethod
+  def parse_users(stdout):
+    return [int(match.group(1)) for match in USER_ID_RE.finditer(stdout)]
+
+  @staticmethod
+  def parse_current_user(stdout):
+    return int(stdout.decode("utf-8").split()[0])
 
-  def user_exists(self, user):
-    users = self.get_all_users()
+  def get_all_users(self):
+    command_output = self.shell.shell_exec(["pm", "list", "users"])
+    return self.parse_users(command_output.stdout)
+
+  def get_user_info(self):
+    """
+    Returns the list of all user IDs and the current user ID, fetched with a
+    single shell command.
+    """
+    stdout = self.shell.shell_exec(["sh", "-c", GET_USER_INFO_SCRIPT]).stdout
+    users, _, current_user = stdout.partition(USER_INFO_SEPARATOR)
+    return self.parse_users(users), self.parse_current_user(current_user)
+
+  def user_exists(self, user, users=None):
+    if users is None:
+      users = self.get_all_users()
     if user not in users:
       return ValidationError(("User ID %s does not exist on device with serial"
                               " %s." % (user, self.shell.id())),
@@ -175,60 +269,82 @@ class AndroidDevice(Device):
     return None
 
   def get_current_user(self):
-    command_output = self.shell.run(["shell", "am", "get-current-user"],
-                                    capture_output=True)
-    return int(command_output.stdout.decode("utf-8").split()[0])
+    command_output = self.shell.shell_exec(
+        ["sh", "-c", GET_CURRENT_USER_COMMAND])
+    return self.parse_current_user(command_output.stdout)
 
   def perform_user_switch(self, user):
-    self.shell.run(["shell", "am", "switch-user", str(user)])
+    self.shell.run(
+        ["shell", "am", "switch-user", str(user)], stdout=subprocess.DEVNULL)
 
   def write_to_file(self, file_path, host_file_string):
-    self.shell.run(["shell", f"cat > {file_path} {host_file_string}"])
+    self.shell.run(["shell", f"cat > {file_path} {host_file_string}"],
+                   stdout=subprocess.DEVNULL)
 
   def set_prop(self, prop, value):
-    self.shell.run(["shell", "setprop", prop, value])
+    self.shell.shell_exec(["setprop", prop, value])
+
+  def set_props(self, props):
+    """
+    Sets each (prop, value) pair in order with a single adb shell command,
+    stopping at the first setprop that fails.
+    """
+    script = " && ".join(
+        shlex.join(("setprop", prop, value)) for prop, value in props)
+    self.shell.shell_exec(["sh", "-c", script])
 
   def clear_prop(self, prop):
-    self.shell.run(["shell", "setprop", prop, "\"\""])
+    self.shell.shell_exec(["setprop", prop, ""])
 
   def reboot(self):
-    self.shell.run(["reboot"])
-    if not self.shell.wait_for_device():
+    self.shell.close()
+    self.invalidate()
+    self.shell.run(["reboot"], stdout=subprocess.DEVNULL)
+    if not self.shell.wait_for_disconnect(WAIT_FOR_DISCONNECT_TIME_OUT_SECS):
       raise Exception(("Device with serial %s took too long to start"
                        " rebooting." % self.shell.id()))
+    if not self.shell.wait_for_device(BOOT_COMPLETED_TIME_OUT_SECS):
+      raise Exception(("Device with serial %s took too long to reconnect after"
+                       " rebooting." % self.shell.id()))
 
   def wait_for_device(self):
-    self.shell.run(["wait-for-device"])
+    self.shell.run(["wait-for-device"], stdout=subprocess.DEVNULL)
 
   def is_boot_completed(self):
-    command_output = self.shell.run(["shell", "getprop", "sys.boot_completed"],
-                                    capture_output=True)
+    command_output = self.shell.shell_exec(["getprop", "sys.boot_completed"])
     return command_output.stdout.decode("utf-8").strip() == "1"
 
   def wait_for_boot_to_complete(self):
-    if not poll_is_task_completed(BOOT_COMPLETED_TIME_OUT_SECS,
-                                  POLLING_INTERVAL_SECS,
-                                  self.is_boot_completed):
+    try:
+      output = self.shell.run(["shell", WAIT_FOR_BOOT_COMPLETED_SCRIPT],
+                              capture_output=True,
+                              timeout=BOOT_COMPLETED_TIME_OUT_SECS + 5,
+                              ignore_returncodes=[ShellExitCodes.EX_FAILURE])
+      boot_completed = not output.returncode
+    except subprocess.TimeoutExpired:
+      boot_completed = False
+    if not boot_completed:
       raise Exception(("Device with serial %s took too long to finish"
                        " rebooting." % self.shell.id()))
 
   def get_packages(self):
+    stdout = self.shell.shell_exec(["pm", "list", "packages"]).stdout
     return [
-        package.removeprefix("package:")
-        for package in self.shell.run(["shell", "pm", "list", "packages"],
-                                      capture_output=True).stdout.decode(
-                                          "utf-8").splitlines()
+        line[len(PACKAGE_PREFIX):].decode("utf-8")
+        for line in stdout.splitlines()
+        if line.startswith(PACKAGE_PREFIX)
     ]
 
   def get_pid(self, process_name):
-    return self.shell.run(["shell", "pidof", process_name],
-                          capture_output=True,
-                          ignore_returncodes=[
-                              ShellExitCodes.EX_FAILURE
-                          ]).stdout.decode("utf-8").split("\n")[0]
+    return self.shell.shell_exec(["pidof", process_name],
+                                 ignore_returncodes=[
+                                     ShellExitCodes.EX_FAILURE
+                                 ]).stdout.partition(b"\n")[0].decode("utf-8")
 
   def is_process_running(self, process_name):
-    return self.get_pid(process_name) != ""
+    output = self.shell.shell_exec(
+        ["pidof", process_name], ignore_returncodes=[ShellExitCodes.EX_FAILURE])
+    return not output.returncode
 
   def start_package(self, package):
     if self.shell.run(["shell", "am", "start", package],
@@ -243,60 +359,55 @@ class AndroidDevice(Device):
     return None
 
   def kill_process(self, name):
-    pid = self.get_pid(name)
-    if pid != "":
-      self.shell.run(["shell", "kill", "-9", pid])
+    self.shell.shell_exec(["sh", "-c", KILL_PROCESS_SCRIPT, name])
 
   def send_signal(self, process_name, signal):
-    self.shell.run(["shell", "pkill", "-l", signal, process_name])
+    self.shell.shell_exec(["pkill", "-l", signal, process_name])
 
   def force_stop_package(self, package):
-    self.shell.run(["shell", "am", "force-stop", package])
+    self.shell.shell_exec(["am", "force-stop", package])
 
   def get_prop(self, prop):
-    return self.shell.run(
-        ["shell", "getprop", prop],
-        capture_output=True).stdout.decode("utf-8").split("\n")[0]
+    return self.shell.shell_exec(["getprop", prop
+                                 ]).stdout.partition(b"\n")[0].decode("utf-8")
 
-  def get_android_sdk_version(self):
+  @cached_property
+  def sdk_version(self):
     return int(self.get_prop("ro.build.version.sdk"))
 
+  def get_android_sdk_version(self):
+    return self.sdk_version
+
+  def invalidate(self):
+    """
+    Drops the cached device properties so that they are queried again after
+    the device restarts.
+    """
+    self.__dict__.pop("sdk_version", None)
+
   def create_directory(self, directory):
-    self.shell.run(["shell", "mkdir", "-p", directory], capture_output=True)
+    self.shell.run(["shell", "mkdir", "-p", directory],
+                   stdout=subprocess.DEVNULL)
     return None
 
   def simpleperf_event_exists(self, simpleperf_events):
-    events_copy = simpleperf_events.copy()
-    grep_command = "grep"
-    for event in simpleperf_events:
-      grep_command += " -e " + event.lower()
-
-    if not self.file_exists("/system/bin/simpleperf"):
-      return ValidationError("Simpleperf was not found in the device.",
-                             "Push the simpleperf binary to the device.")
-
-    output = self.shell.run(["shell", "simpleperf", "list", "|", grep_command],
-                            capture_output=True,
-                            ignore_returncodes=[ShellExitCodes.EX_FAILURE])
-
-    lines = output.stdout.decode("utf-8").split("\n")
-
-    # Anything that does not start with two spaces is not a command.
-    # Any command with a space will have the command before the first space.
-    for line in lines:
-      if len(line) <= 3 or line[:2] != "  " or line[2] == "#":
-        # Line doesn't contain a simpleperf event
-        continue
-      event = line[2:].split(" ")[0]
-      if event in events_copy:
-        events_copy.remove(event)
-        if len(events_copy) == 0:
-          # All of the events exist, exit early
-          break
-
-    if len(events_copy) > 0:
+    if self.simpleperf_events is None:
+      if not self.file_exists("/system/bin/simpleperf"):
+        return ValidationError("Simpleperf was not found in the device.",
+                               "Push the simpleperf binary to the device.")
+      output = self.shell.shell_exec(
+          ["simpleperf", "list"],
+          ignore_returncodes=[ShellExitCodes.EX_FAILURE])
+      self.simpleperf_events = frozenset(
+          SIMPLEPERF_EVENT_RE.findall(output.stdout.decode("utf-8")))
+
+    invalid_events = [
+        event for event in simpleperf_events
+        if event not in self.simpleperf_events
+    ]
+    if len(invalid_events) > 0:
       return ValidationError(
           "The following simpleperf event(s) are invalid:"
-          " %s." % events_copy, "Run adb shell simpleperf list to"
+          " %s." % invalid_events, "Run adb shell simpleperf list to"
           " see valid simpleperf events.")
     return None
@@ -15,7 +15,6 @@
 #
 
 from .base import ValidationError
-from .open_ui_utils import open_trace, WEB_UI_ADDRESS
 from .utils import path_exists
 
 
@@ -44,4 +43,5 @@ def verify_open_args(args):
 
 
 def execute_open_command(args, device):
+  from .open_ui_utils import open_trace, WEB_UI_ADDRESS
   return open_trace(args.file_path, WEB_UI_ADDRESS, args.use_trace_processor)
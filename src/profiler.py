@@ -14,28 +14,28 @@
 # limitations under the License.
 #
 
-import argparse
 import datetime
+import operator
 import os
 import time
 
 from .base import (ANDROID_SDK_VERSION_T, Command, CommandExecutor,
                    ValidationError)
 from .config_builder import (build_custom_config, create_common_config_parser,
-                             PREDEFINED_PERFETTO_CONFIGS)
-from .device import SIMPLEPERF_TRACE_FILE
+                             PREDEFINED_PERFETTO_CONFIGS, strip_heredoc)
+from .device import PERFETTO_TRACE_FILE, SIMPLEPERF_TRACE_FILE
 from .handle_input import HandleInput
-from .open_ui_utils import open_trace, WEB_UI_ADDRESS
 from .utils import convert_simpleperf_to_gecko, poll_is_task_completed, POLLING_INTERVAL_SECS
 from .validate_simpleperf import verify_simpleperf_args
 
+PROFILER_EVENTS = ("boot", "user-switch", "app-startup", "custom")
+PROFILERS = ("perfetto", "simpleperf")
 DEFAULT_DUR_MS = 10000
 DEFAULT_OUT_DIR = "."
 MAX_WAIT_FOR_INIT_USER_SWITCH_SECS = 180
 MIN_DURATION_MS = 3000
 MIN_STOP_DELAY_MS = 1000
 PERFETTO_DEVICE_FOLDER = "/data/misc/perfetto-traces"
-PERFETTO_TRACE_FILE = PERFETTO_DEVICE_FOLDER + "/trace.perfetto-trace"
 PERFETTO_BOOT_TRACE_FILE = PERFETTO_DEVICE_FOLDER + "/boottrace.perfetto-trace"
 SIMPLEPERF_DEVICE_TRACE_FOLDER = "/tmp/simpleperf-traces"
 SIMPLEPERF_STOP_TIMEOUT_SECS = 60
@@ -43,6 +43,69 @@ TRACE_START_DELAY_SECS = 0.5
 DEFAULT_TRIGGER_DUR_MS = 604800000  # 7 days in millis
 DEFAULT_TRIGGER_STOP_DELAY_MS = [1000]
 DEFAULT_TRIGGER_MODE = "STOP_TRACING"
+# The arguments of ProfilerCommand after its type, in order.
+PROFILER_COMMAND_ARGS = operator.attrgetter(
+    "event", "profiler", "out_dir", "dur_ms", "app", "runs", "simpleperf_event",
+    "perfetto_config", "between_dur_ms", "ui", "excluded_ftrace_events",
+    "included_ftrace_events", "from_user", "to_user", "scripts_path", "symbols",
+    "trigger_names", "trigger_timeout_ms", "trigger_stop_delay_ms",
+    "trigger_mode")
+TRIGGER_MODE_ALIASES = {
+    "stop": "STOP_TRACING",
+    "start": "START_TRACING",
+    "clone": "CLONE_SNAPSHOT"
+}
+PERFETTO_CONFIG_HELP = ("Predefined perfetto configs can be used: %s. A"
+                        " filepath with a custom config could also be"
+                        " provided." %
+                        ", ".join(PREDEFINED_PERFETTO_CONFIGS.keys()))
+PERFETTO_CONFIG_SUGGESTION = (
+    "Predefined perfetto configs can be used:\n"
+    "\t torq --perfetto-config %s\n"
+    "\t A filepath with a config can also be used:\n"
+    "\t torq --perfetto-config <config-filepath>" %
+    "\n\t torq --perfetto-config ".join(PREDEFINED_PERFETTO_CONFIGS.keys()))
+
+# Arguments that can only be passed along with another argument's value, as
+# argument: (required argument, required value, error message, suggestion).
+# Suggestions are formatted with the passed value of the argument.
+CROSS_ARGUMENT_REQUIREMENTS = {
+    "from_user":
+        ("event", "user-switch",
+         ("Command is invalid because --from-user is passed, but --event is"
+          " not set to user-switch."),
+         ("Set --event user-switch --from-user %(value)s to perform a"
+          " user-switch from user %(value)s.")),
+    "to_user":
+        ("event", "user-switch",
+         ("Command is invalid because --to-user is passed, but --event is not"
+          " set to user-switch."),
+         ("Set --event user-switch --to-user %(value)s to perform a"
+          " user-switch to user %(value)s.")),
+    "app": ("event", "app-startup",
+            ("Command is invalid because --app is passed and --event is not"
+             " set to app-startup."),
+            ("To profile an app startup run:"
+             " torq --event app-startup --app <package-name>")),
+    "simpleperf_event":
+        ("profiler", "simpleperf",
+         ("Command is invalid because --simpleperf-event cannot be passed"
+          " if --profiler is not set to simpleperf."),
+         ("To capture the simpleperf event run:"
+          " torq --profiler simpleperf --simpleperf-event %(value)s")),
+    "excluded_ftrace_events":
+        ("profiler", "perfetto",
+         ("Command is invalid because --excluded-ftrace-events cannot be"
+          " passed if --profiler is not set to perfetto."),
+         ("Set --profiler perfetto to exclude an"
+          " ftrace event from perfetto config.")),
+    "included_ftrace_events":
+        ("profiler", "perfetto",
+         ("Command is invalid because --included-ftrace-events cannot be"
+          " passed if --profiler is not set to perfetto."),
+         ("Set --profiler perfetto to include an"
+          " ftrace event in perfetto config.")),
+}
 
 
 def add_profiler_parser(subparsers):
@@ -55,13 +118,13 @@ def add_profiler_parser(subparsers):
   profiler_parser.add_argument(
       '-e',
       '--event',
-      choices=['boot', 'user-switch', 'app-startup', 'custom'],
+      choices=PROFILER_EVENTS,
       default='custom',
       help='The event to trace/profile.')
   profiler_parser.add_argument(
       '-p',
       '--profiler',
-      choices=['perfetto', 'simpleperf'],
+      choices=PROFILERS,
       default='perfetto',
       help='The performance data source.')
   profiler_parser.add_argument(
@@ -85,12 +148,7 @@ def add_profiler_parser(subparsers):
       help=('Simpleperf supported events to be collected.'
             ' e.g. cpu-cycles, instructions'))
   profiler_parser.add_argument(
-      '--perfetto-config',
-      default='default',
-      help=('Predefined perfetto configs can be used:'
-            ' %s. A filepath with a custom config could'
-            ' also be provided.' %
-            (", ".join(PREDEFINED_PERFETTO_CONFIGS.keys()))))
+      '--perfetto-config', default='default', help=PERFETTO_CONFIG_HELP)
   profiler_parser.add_argument(
       '--between-dur-ms',
       type=int,
@@ -98,9 +156,17 @@ def add_profiler_parser(subparsers):
       help='Time (ms) to wait before executing the next event.')
   profiler_parser.add_argument(
       '--ui',
-      action=argparse.BooleanOptionalAction,
+      action='store_true',
+      default=None,
       help=('Specifies opening of UI visualization tool'
             ' after profiling is complete.'))
+  profiler_parser.add_argument(
+      '--no-ui',
+      action='store_false',
+      dest='ui',
+      default=None,
+      help=('Specifies not opening the UI visualization tool'
+            ' after profiling is complete.'))
   profiler_parser.add_argument(
       '--from-user',
       type=int,
@@ -113,12 +179,19 @@ def add_profiler_parser(subparsers):
       '--symbols', help='Specifies path to symbols library.')
 
 
-def verify_profiler_args(args):
-  if args.out_dir != DEFAULT_OUT_DIR and not os.path.isdir(args.out_dir):
-    return None, ValidationError(
-        ("Command is invalid because --out-dir is not a valid directory"
-         " path: %s." % args.out_dir), None)
+def verify_cross_argument(args, argument):
+  required_argument, required_value, message, suggestion = (
+      CROSS_ARGUMENT_REQUIREMENTS[argument])
+  value = getattr(args, argument)
+  if value is None or getattr(args, required_argument) == required_value:
+    return None
+  if isinstance(value, list):
+    # Arguments that can be passed more than once are repeated per value.
+    value = (" --%s " % argument.replace("_", "-")).join(value)
+  return ValidationError(message, suggestion % {"value": value})
 
+
+def verify_profiler_args(args):
   if args.dur_ms is not None and args.dur_ms < MIN_DURATION_MS:
     return None, ValidationError(
         ("Command is invalid because --dur-ms cannot be set to a value smaller"
@@ -126,19 +199,10 @@ def verify_profiler_args(args):
         ("Set --dur-ms %d to capture a trace for %d seconds." %
          (MIN_DURATION_MS, (MIN_DURATION_MS / 1000))))
 
-  if args.from_user is not None and args.event != "user-switch":
-    return None, ValidationError(
-        ("Command is invalid because --from-user is passed, but --event is not"
-         " set to user-switch."),
-        ("Set --event user-switch --from-user %s to perform a user-switch from"
-         " user %s." % (args.from_user, args.from_user)))
-
-  if args.to_user is not None and args.event != "user-switch":
-    return None, ValidationError((
-        "Command is invalid because --to-user is passed, but --event is not set"
-        " to user-switch."
-    ), ("Set --event user-switch --to-user %s to perform a user-switch to user"
-        " %s." % (args.to_user, args.to_user)))
+  for argument in ("from_user", "to_user"):
+    error = verify_cross_argument(args, argument)
+    if error is not None:
+      return None, error
 
   if args.event == "user-switch" and args.to_user is None:
     return None, ValidationError(
@@ -153,12 +217,9 @@ def verify_profiler_args(args):
         "Boot event is not yet implemented for simpleperf.",
         "Please try another event.")
 
-  if args.app is not None and args.event != "app-startup":
-    return None, ValidationError(
-        ("Command is invalid because --app is passed and --event is not set"
-         " to app-startup."),
-        ("To profile an app startup run:"
-         " torq --event app-startup --app <package-name>"))
+  error = verify_cross_argument(args, "app")
+  if error is not None:
+    return None, error
 
   if args.event == "app-startup" and args.app is None:
     return None, ValidationError(
@@ -178,13 +239,9 @@ def verify_profiler_args(args):
          " than 1."),
         ("Set torq -r %d --no-ui to perform %d runs." % (args.runs, args.runs)))
 
-  if args.simpleperf_event is not None and args.profiler != "simpleperf":
-    return None, ValidationError(
-        ("Command is invalid because --simpleperf-event cannot be passed"
-         " if --profiler is not set to simpleperf."),
-        ("To capture the simpleperf event run:"
-         " torq --profiler simpleperf --simpleperf-event %s" %
-         " --simpleperf-event ".join(args.simpleperf_event)))
+  error = verify_cross_argument(args, "simpleperf_event")
+  if error is not None:
+    return None, error
 
   if (args.simpleperf_event is not None and
       len(args.simpleperf_event) != len(set(args.simpleperf_event))):
@@ -202,18 +259,6 @@ def verify_profiler_args(args):
           ("Set --profiler perfetto to choose a perfetto-config"
            " to use."))
 
-  if (args.perfetto_config not in PREDEFINED_PERFETTO_CONFIGS and
-      not os.path.isfile(args.perfetto_config)):
-    return None, ValidationError(
-        ("Command is invalid because --perfetto-config is not a valid"
-         " file path: %s" % args.perfetto_config),
-        ("Predefined perfetto configs can be used:\n"
-         "\t torq --perfetto-config %s\n"
-         "\t A filepath with a config can also be used:\n"
-         "\t torq --perfetto-config <config-filepath>" %
-         ("\n\t torq --perfetto-config"
-          " ".join(PREDEFINED_PERFETTO_CONFIGS.keys()))))
-
   if args.between_dur_ms < MIN_DURATION_MS:
     return None, ValidationError(
         ("Command is invalid because --between-dur-ms cannot be set to a"
@@ -227,49 +272,57 @@ def verify_profiler_args(args):
          " if --runs is not a value greater than 1."),
         "Set --runs 2 to run 2 tests.")
 
-  if args.excluded_ftrace_events is not None and args.profiler != "perfetto":
-    return None, ValidationError(
-        ("Command is invalid because --excluded-ftrace-events cannot be passed"
-         " if --profiler is not set to perfetto."),
-        ("Set --profiler perfetto to exclude an ftrace event"
-         " from perfetto config."))
+  error = verify_cross_argument(args, "excluded_ftrace_events")
+  if error is not None:
+    return None, error
 
-  if (args.excluded_ftrace_events is not None and len(
-      args.excluded_ftrace_events) != len(set(args.excluded_ftrace_events))):
+  # The sets are reused to find events that are both included and excluded.
+  excluded_ftrace_events = set(args.excluded_ftrace_events or [])
+  if (args.excluded_ftrace_events is not None and
+      len(args.excluded_ftrace_events) != len(excluded_ftrace_events)):
     return None, ValidationError(
         ("Command is invalid because duplicate ftrace events cannot be"
          " included in --excluded-ftrace-events."),
         ("--excluded-ftrace-events should only include one instance of an"
          " ftrace event."))
 
-  if args.included_ftrace_events is not None and args.profiler != "perfetto":
-    return None, ValidationError(
-        ("Command is invalid because --included-ftrace-events cannot be passed"
-         " if --profiler is not set to perfetto."),
-        ("Set --profiler perfetto to include an ftrace event"
-         " in perfetto config."))
+  error = verify_cross_argument(args, "included_ftrace_events")
+  if error is not None:
+    return None, error
 
-  if (args.included_ftrace_events is not None and len(
-      args.included_ftrace_events) != len(set(args.included_ftrace_events))):
+  included_ftrace_events = set(args.included_ftrace_events or [])
+  if (args.included_ftrace_events is not None and
+      len(args.included_ftrace_events) != len(included_ftrace_events)):
     return None, ValidationError(
         ("Command is invalid because duplicate ftrace events cannot be"
          " included in --included-ftrace-events."),
         ("--included-ftrace-events should only include one instance of an"
          " ftrace event."))
 
-  if (args.included_ftrace_events is not None and
-      args.excluded_ftrace_events is not None):
-    ftrace_event_intersection = sorted(
-        (set(args.excluded_ftrace_events) & set(args.included_ftrace_events)))
-    if len(ftrace_event_intersection):
-      return None, ValidationError(
-          ("Command is invalid because ftrace event(s): %s cannot be both"
-           " included and excluded." % ", ".join(ftrace_event_intersection)),
-          ("\n\t ".join("Only set --excluded-ftrace-events %s if you want to"
-                        " exclude %s from the config or"
-                        " --included-ftrace-events %s if you want to include %s"
-                        " in the config." % (event, event, event, event)
-                        for event in ftrace_event_intersection)))
+  ftrace_event_intersection = excluded_ftrace_events & included_ftrace_events
+  if ftrace_event_intersection:
+    ftrace_event_intersection = sorted(ftrace_event_intersection)
+    return None, ValidationError(
+        ("Command is invalid because ftrace event(s): %s cannot be both"
+         " included and excluded." % ", ".join(ftrace_event_intersection)),
+        ("\n\t ".join("Only set --excluded-ftrace-events %s if you want to"
+                      " exclude %s from the config or"
+                      " --included-ftrace-events %s if you want to include %s"
+                      " in the config." % (event, event, event, event)
+                      for event in ftrace_event_intersection)))
+
+  # Checks that touch the file system go last, so that invalid combinations
+  # of arguments are rejected before any stat() call is made.
+  if args.out_dir != DEFAULT_OUT_DIR and not os.path.isdir(args.out_dir):
+    return None, ValidationError(
+        ("Command is invalid because --out-dir is not a valid directory"
+         " path: %s." % args.out_dir), None)
+
+  if (args.perfetto_config not in PREDEFINED_PERFETTO_CONFIGS and
+      not os.path.isfile(args.perfetto_config)):
+    return None, ValidationError(
+        ("Command is invalid because --perfetto-config is not a valid"
+         " file path: %s" % args.perfetto_config), PERFETTO_CONFIG_SUGGESTION)
 
   if args.profiler == "simpleperf" and args.simpleperf_event is None:
     args.simpleperf_event = ['cpu-cycles']
@@ -357,13 +410,8 @@ def verify_trigger_args(args):
         ("Set --trigger-stop-delay-ms %d to keep tracing after a trigger for %d"
          " seconds." % (MIN_STOP_DELAY_MS, (MIN_STOP_DELAY_MS / 1000))))
 
-  match args.trigger_mode:
-    case "stop":
-      args.trigger_mode = "STOP_TRACING"
-    case "start":
-      args.trigger_mode = "START_TRACING"
-    case "clone":
-      args.trigger_mode = "CLONE_SNAPSHOT"
+  args.trigger_mode = TRIGGER_MODE_ALIASES.get(args.trigger_mode,
+                                               args.trigger_mode)
 
   # CLONE_SNAPSHOT will generate multiple traces, so don't automatically open
   # traces in the Perfetto UI
@@ -388,13 +436,7 @@ def get_executor(event):
 
 
 def execute_profiler_command(args, device):
-  command = ProfilerCommand(
-      "profiler", args.event, args.profiler, args.out_dir, args.dur_ms,
-      args.app, args.runs, args.simpleperf_event, args.perfetto_config,
-      args.between_dur_ms, args.ui, args.excluded_ftrace_events,
-      args.included_ftrace_events, args.from_user, args.to_user,
-      args.scripts_path, args.symbols, args.trigger_names,
-      args.trigger_timeout_ms, args.trigger_stop_delay_ms, args.trigger_mode)
+  command = ProfilerCommand("profiler", *PROFILER_COMMAND_ARGS(args))
 
   executor = get_executor(command.event)
 
@@ -459,14 +501,14 @@ class ProfilerCommand(Command):
         return self.validate_app_startup(device)
 
   def validate_user_switch(self, device):
-    error = device.user_exists(self.to_user)
+    users, self.original_user = device.get_user_info()
+    error = device.user_exists(self.to_user, users)
     if error is not None:
       return error
-    self.original_user = device.get_current_user()
     if self.from_user is None:
       self.from_user = self.original_user
     else:
-      error = device.user_exists(self.from_user)
+      error = device.user_exists(self.from_user, users)
       if error is not None:
         return error
     if self.from_user == self.to_user:
@@ -566,6 +608,8 @@ class ProfilerCommandExecutor(CommandExecutor):
     if error is not None:
       return error
     if command.use_ui:
+      # Only load the UI server when there is a trace to open.
+      from .open_ui_utils import open_trace, WEB_UI_ADDRESS
       error = open_trace(
           host_raw_trace_filename if command.profiler == "perfetto" else
           host_gecko_trace_filename, WEB_UI_ADDRESS, False)
@@ -586,14 +630,14 @@ class ProfilerCommandExecutor(CommandExecutor):
 
   def prepare_device_for_run(self, command, device):
     if command.profiler == "perfetto":
-      device.remove_file(f"{PERFETTO_TRACE_FILE}*")
+      device.ensure_removed(PERFETTO_TRACE_FILE, with_suffixes=True)
     else:
-      device.remove_file(SIMPLEPERF_TRACE_FILE)
+      device.ensure_removed(SIMPLEPERF_TRACE_FILE)
 
   def execute_run(self, command, device, config, run):
     print("Performing run %s. Press CTRL+C to end the trace." % run)
     if command.profiler == "perfetto":
-      process = device.start_perfetto_trace(config)
+      process = device.start_perfetto_trace(strip_heredoc(config))
     else:
       process = device.start_simpleperf_trace(command)
     time.sleep(TRACE_START_DELAY_SECS)
@@ -709,7 +753,7 @@ class BootCommandExecutor(ProfilerCommandExecutor):
     device.write_to_file("/data/misc/perfetto-configs/boottrace.pbtxt", config)
 
   def prepare_device_for_run(self, command, device):
-    device.remove_file(f'{PERFETTO_BOOT_TRACE_FILE}*')
+    device.ensure_removed(PERFETTO_BOOT_TRACE_FILE, with_suffixes=True)
     device.set_prop("persist.debug.perfetto.boottrace", "1")
 
   def execute_run(self, command, device, config, run):
@@ -15,14 +15,25 @@
 #
 
 import os
+import re
+import selectors
+import shlex
 import subprocess
 import sys
+import time
 from abc import ABC, abstractmethod
 from .base import ValidationError
 from .handle_input import HandleInput
 from .utils import poll_is_task_completed, POLLING_INTERVAL_SECS, run_subprocess, ShellExitCodes
 
-WAIT_FOR_DEVICE_TIME_OUT_SECS = 5
+ADB_DEVICES_CACHE_TTL_SECS = 0.25
+SHELL_EXEC_END_MARKER = b"__TORQ_END__"
+# Matches the end marker line, holding the exit status of the command, that
+# the persistent shell writes to stdout after the output of each command.
+SHELL_EXEC_END_RE = re.compile(rb"%s (\d+)\n" % SHELL_EXEC_END_MARKER)
+# Matches the serial of each '<serial>\tdevice' line of 'adb devices'. Devices
+# in any other state (offline, unauthorized, ...) are skipped.
+ADB_DEVICE_RE = re.compile(rb"(?m)^(\S+)\t+device[ \t\r]*$")
 
 
 class Shell(ABC):
@@ -38,6 +49,10 @@ class Shell(ABC):
   def popen(self, args):
     raise NotImplementedError
 
+  @abstractmethod
+  def popen_with_stdin(self, args, stdin_data):
+    raise NotImplementedError
+
   @abstractmethod
   def run(self,
           args,
@@ -58,22 +73,30 @@ class Shell(ABC):
     raise NotImplementedError
 
   @abstractmethod
-  def wait_for_device(self):
+  def shell_exec(self, args, ignore_returncodes=[], timeout=None):
+    raise NotImplementedError
+
+  @abstractmethod
+  def wait_for_disconnect(self, timeout):
+    raise NotImplementedError
+
+  @abstractmethod
+  def wait_for_device(self, timeout):
+    raise NotImplementedError
+
+  @abstractmethod
+  def close(self):
     raise NotImplementedError
 
 
 class AdbShell(Shell):
 
+  # (monotonic timestamp, devices) of the last 'adb devices' call
+  _devices_cache = (None, [])
+
   @staticmethod
-  def adb_exists():
-    # adb returns 1 when it runs, so ignore this error code.
-    return not run_subprocess(
-        "adb",
-        capture_output=True,
-        shell=True,
-        ignore_returncodes=[
-            ShellExitCodes.EX_FAILURE, ShellExitCodes.EX_NOTFOUND
-        ]).returncode == ShellExitCodes.EX_NOTFOUND
+  def invalidate_devices_cache():
+    AdbShell._devices_cache = (None, [])
 
   @staticmethod
   def get_adb_devices():
@@ -83,24 +106,29 @@ class AdbShell(Shell):
     List of devices attached
     SOMEDEVICE1234    device
     device2:5678    device
+
+    The result is reused for ADB_DEVICES_CACHE_TTL_SECS.
     """
+    timestamp, devices = AdbShell._devices_cache
+    if (timestamp is not None and
+        time.monotonic() - timestamp < ADB_DEVICES_CACHE_TTL_SECS):
+      return list(devices)
     command_output = run_subprocess(["adb", "devices"], capture_output=True)
-    output_lines = command_output.stdout.decode("utf-8").split("\n")
-    devices = []
-    for line in output_lines[:-2]:
-      if line[0] == "*" or line == "List of devices attached":
-        continue
-      words_in_line = line.split('\t')
-      if words_in_line[1] == "device":
-        devices.append(words_in_line[0])
-    return devices
+    devices = [
+        serial.decode("utf-8")
+        for serial in ADB_DEVICE_RE.findall(command_output.stdout)
+    ]
+    AdbShell._devices_cache = (time.monotonic(), devices)
+    return list(devices)
 
   @staticmethod
   def get_default_serial():
-    if not AdbShell.adb_exists():
+    # Running adb is enough to find out if it exists, so don't probe first.
+    try:
+      devices = AdbShell.get_adb_devices()
+    except FileNotFoundError:
       return None, ValidationError("adb could not be found on the host device.",
                                    None)
-    devices = AdbShell.get_adb_devices()
     if len(devices) == 0:
       return None, ValidationError("There are currently no devices connected.",
                                    None)
@@ -114,16 +142,14 @@ class AdbShell(Shell):
     elif len(devices) == 1:
       serial = devices[0]
     else:
-      options = ""
-      choices = {}
-      for i, device in enumerate(devices):
-        options += ("%d: torq --serial %s %s\n\t" %
-                    (i, device, " ".join(sys.argv[1:])))
-        # Lambdas are bound to local scope, so assign var d to prevent
-        # future values of device from overriding the current value we want
-        choices[str(i)] = lambda d=device: d
-      # Remove last \t
-      options = options[:-1]
+      args = " ".join(sys.argv[1:])
+      options = "\n\t".join("%d: torq --serial %s %s" % (i, device, args)
+                            for i, device in enumerate(devices)) + "\n"
+      # Lambdas are bound to local scope, so assign var d to prevent
+      # future values of device from overriding the current value we want
+      choices = {
+          str(i): (lambda d=device: d) for i, device in enumerate(devices)
+      }
       chosen_serial = (
           HandleInput(
               "There is more than one device currently "
@@ -140,10 +166,12 @@ class AdbShell(Shell):
 
   @staticmethod
   def verify_serial(serial):
-    assert serial is not None, "serial cannot be None"
-    if not AdbShell.adb_exists():
+    if serial is None:
+      raise TypeError("serial cannot be None")
+    try:
+      devices = AdbShell.get_adb_devices()
+    except FileNotFoundError:
       return ValidationError("adb could not be found on the host device.", None)
-    devices = AdbShell.get_adb_devices()
     if len(devices) == 0:
       return ValidationError("There are currently no devices connected.", None)
     if serial not in devices:
@@ -151,17 +179,35 @@ class AdbShell(Shell):
           ("Device with serial %s is not connected." % serial), None)
     return None
 
-  def __init__(self, serial):
+  def __init__(self, serial, persistent=False):
     self.serial = serial
+    self.persistent = persistent
+    self._persistent_shell = None
+    # Built once since every command is prefixed with it. Commands are
+    # unpacked after it, so they can be given as lists or tuples.
+    self.adb_prefix = ("adb", "-s", serial)
 
   def id(self):
     return self.serial
 
   def popen(self, args):
-    is_list = isinstance(args, list)
-    prefix = ["adb", "-s", self.serial]
-    cmd = prefix + args if is_list else f"{' '.join(prefix)} {args}"
-    return subprocess.Popen(cmd, shell=(not is_list))
+    is_str = isinstance(args, str)
+    cmd = (f"{' '.join(self.adb_prefix)} {args}"
+           if is_str else [*self.adb_prefix, *args])
+    return subprocess.Popen(cmd, shell=is_str)
+
+  def popen_with_stdin(self, args, stdin_data):
+    """
+    Starts the command and writes stdin_data to its stdin, then closes it so
+    the command sees the end of its input.
+    """
+    process = subprocess.Popen([*self.adb_prefix, *args], stdin=subprocess.PIPE)
+    try:
+      process.stdin.write(stdin_data)
+      process.stdin.close()
+    except BrokenPipeError:
+      pass
+    return process
 
   def run(self,
           args,
@@ -179,12 +225,129 @@ class AdbShell(Shell):
           text=None,
           env=None,
           universal_newlines=None):
-    return run_subprocess(["adb", "-s", self.serial] + args, ignore_returncodes,
-                          stdin, input, stdout, stderr, capture_output, shell,
-                          cwd, timeout, encoding, errors, text, env,
+    return run_subprocess([*self.adb_prefix, *args], ignore_returncodes, stdin,
+                          input, stdout, stderr, capture_output, shell, cwd,
+                          timeout, encoding, errors, text, env,
                           universal_newlines)
 
-  def wait_for_device(self):
+  def shell_exec(self, args, ignore_returncodes=[], timeout=None):
+    """
+    Runs args as an 'adb shell' command and returns the completed process.
+    Each argument is quoted, so commands that need shell syntax must be run
+    as a script with 'sh -c'.
+    When the shell is persistent, the command is written to a single
+    long-lived 'adb shell' process, which is read until the end markers,
+    instead of forking a new adb process for every command. The command only
+    runs in its own adb process if it couldn't be written to the persistent
+    shell, so that it never runs twice.
+    """
+    quoted_args = [shlex.quote(arg) for arg in args]
+    if self.persistent:
+      output = self._persistent_shell_exec(" ".join(quoted_args), timeout)
+      if output is not None:
+        if output.returncode and output.returncode not in ignore_returncodes:
+          output.check_returncode()
+        return output
+    return self.run(["shell", *quoted_args],
+                    ignore_returncodes=ignore_returncodes,
+                    capture_output=True,
+                    timeout=timeout)
+
+  def _persistent_shell_exec(self, command, timeout):
+    """
+    Returns the completed process of command run in the persistent shell, or
+    None if the shell exited before the command was written to it. Once the
+    command is written, the shell is killed and an error is raised if it
+    exits or doesn't answer within timeout seconds.
+    """
+    process = self._get_persistent_shell()
+    try:
+      # stdin is the shell's command stream, so the command must not read it.
+      process.stdin.write(b"%s </dev/null; echo %s $?; echo %s >&2\n" %
+                          (command.encode("utf-8"), SHELL_EXEC_END_MARKER,
+                           SHELL_EXEC_END_MARKER))
+      process.stdin.flush()
+    except BrokenPipeError:
+      self._kill_persistent_shell()
+      return None
+    stderr_end = SHELL_EXEC_END_MARKER + b"\n"
+    returncode = None
+    stdout = stderr = b""
+    deadline = None if timeout is None else time.monotonic() + timeout
+    with selectors.DefaultSelector() as selector:
+      selector.register(process.stdout, selectors.EVENT_READ)
+      selector.register(process.stderr, selectors.EVENT_READ)
+      while selector.get_map():
+        events = selector.select(None if deadline is
+                                 None else max(deadline - time.monotonic(), 0))
+        if not events:
+          self._kill_persistent_shell()
+          raise subprocess.TimeoutExpired([*self.adb_prefix, "shell", command],
+                                          timeout, stdout, stderr)
+        for key, _ in events:
+          data = os.read(key.fd, 4096)
+          if not data:
+            self._kill_persistent_shell()
+            raise Exception(("adb shell on device with serial %s exited"
+                             " unexpectedly." % self.serial))
+          if key.fileobj is process.stdout:
+            stdout += data
+            match = SHELL_EXEC_END_RE.search(stdout)
+            if match is not None:
+              returncode = int(match.group(1))
+              stdout = stdout[:match.start()]
+              selector.unregister(process.stdout)
+          else:
+            stderr += data
+            if stderr.endswith(stderr_end):
+              stderr = stderr[:-len(stderr_end)]
+              selector.unregister(process.stderr)
+    return subprocess.CompletedProcess([*self.adb_prefix, "shell", command],
+                                       returncode, stdout, stderr)
+
+  def _get_persistent_shell(self):
+    if self._persistent_shell is None or self._persistent_shell.poll(
+    ) is not None:
+      self._persistent_shell = subprocess.Popen([*self.adb_prefix, "shell"],
+                                                stdin=subprocess.PIPE,
+                                                stdout=subprocess.PIPE,
+                                                stderr=subprocess.PIPE)
+    return self._persistent_shell
+
+  def _kill_persistent_shell(self):
+    # The shell is respawned by the next command that needs it.
+    self._persistent_shell.kill()
+    self._persistent_shell.wait()
+    self._persistent_shell = None
+
+  def close(self):
+    if self._persistent_shell is None:
+      return
+    if self._persistent_shell.poll() is None:
+      self._persistent_shell.terminate()
+      self._persistent_shell.wait()
+    self._persistent_shell = None
+
+  def wait_for_disconnect(self, timeout):
+    """
+    Polls 'adb get-state' until the device is gone, e.g. while adbd restarts.
+    Returns False if it is still connected after timeout seconds.
+    """
+    AdbShell.invalidate_devices_cache()
     return poll_is_task_completed(
-        WAIT_FOR_DEVICE_TIME_OUT_SECS, POLLING_INTERVAL_SECS,
-        lambda: self.serial in AdbShell.get_adb_devices())
+        timeout, POLLING_INTERVAL_SECS, lambda: self.run(
+            ["get-state"],
+            capture_output=True,
+            ignore_returncodes=[ShellExitCodes.EX_FAILURE]).returncode != 0)
+
+  def wait_for_device(self, timeout):
+    """
+    Blocks on 'adb wait-for-device' until the device is connected. Returns
+    False if it doesn't connect within timeout seconds.
+    """
+    AdbShell.invalidate_devices_cache()
+    try:
+      self.run(["wait-for-device"], timeout=timeout)
+    except subprocess.TimeoutExpired:
+      return False
+    return True
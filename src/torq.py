@@ -15,58 +15,78 @@
 #
 
 import argparse
+import importlib
 import sys
 
-from .config import (add_config_parser, execute_config_command,
-                     verify_config_args)
-from .device import get_device
-from .open import (add_open_parser, execute_open_command, verify_open_args)
-from .profiler import (add_profiler_parser, execute_profiler_command,
-                       verify_profiler_args)
-from .trigger import (add_trigger_parser, execute_trigger_command,
-                      verify_trigger_args)
 from .utils import set_default_subparser
-from .vm import add_vm_parser, execute_vm_command, verify_vm_args
 
 # Add default parser capability to argparse
 argparse.ArgumentParser.set_default_subparser = set_default_subparser
 
-# Torq supported commands
+# Torq supported commands. Each command's functions are looked up by name in
+# its module, which is only imported once the command is used.
 #
 # NOTE: Add your new commands here
 #
 TORQ_COMMANDS = {
     'config': {
-        'parse': add_config_parser,
-        'verify': verify_config_args,
-        'execute': execute_config_command,
+        'module': '.config',
+        'parse': 'add_config_parser',
+        'verify': 'verify_config_args',
+        'execute': 'execute_config_command',
         'require_device': False,
     },
     'open': {
-        'parse': add_open_parser,
-        'verify': verify_open_args,
-        'execute': execute_open_command,
+        'module': '.open',
+        'parse': 'add_open_parser',
+        'verify': 'verify_open_args',
+        'execute': 'execute_open_command',
         'require_device': False,
     },
     'profiler': {
-        'parse': add_profiler_parser,
-        'verify': verify_profiler_args,
-        'execute': execute_profiler_command,
+        'module': '.profiler',
+        'parse': 'add_profiler_parser',
+        'verify': 'verify_profiler_args',
+        'execute': 'execute_profiler_command',
         'require_device': True,
     },
     'trigger': {
-        'parse': add_trigger_parser,
-        'verify': verify_trigger_args,
-        'execute': execute_trigger_command,
+        'module': '.trigger',
+        'parse': 'add_trigger_parser',
+        'verify': 'verify_trigger_args',
+        'execute': 'execute_trigger_command',
         'require_device': True,
     },
     'vm': {
-        'parse': add_vm_parser,
-        'verify': verify_vm_args,
-        'execute': execute_vm_command,
+        'module': '.vm',
+        'parse': 'add_vm_parser',
+        'verify': 'verify_vm_args',
+        'execute': 'execute_vm_command',
         'require_device': False,  # configure command doesn't rely on --serial
     },
 }
+DEFAULT_SUBCOMMAND = 'profiler'
+HELP_OPTIONS = ('-h', '--help')
+
+
+def get_command_function(command, function):
+  module = importlib.import_module(TORQ_COMMANDS[command]['module'],
+                                   __package__)
+  return getattr(module, TORQ_COMMANDS[command][function])
+
+
+def get_subcommands_to_parse():
+  """
+  Returns the subcommands whose parsers need to be built to parse sys.argv.
+  Only the parser of the subcommand being run is built, unless the top-level
+  help, which lists all subcommands, may be printed.
+  """
+  for arg in sys.argv[1:]:
+    if arg in TORQ_COMMANDS:
+      return [arg]
+    if arg in HELP_OPTIONS:
+      return list(TORQ_COMMANDS)
+  return [DEFAULT_SUBCOMMAND]
 
 
 def create_parser():
@@ -84,11 +104,11 @@ def create_parser():
 
   subparsers = parser.add_subparsers(dest='subcommands', help='Subcommands')
 
-  for command in TORQ_COMMANDS:
-    TORQ_COMMANDS[command]['parse'](subparsers)
+  for command in get_subcommands_to_parse():
+    get_command_function(command, 'parse')(subparsers)
 
   # Set 'profiler' as the default parser
-  error = parser.set_default_subparser('profiler')
+  error = parser.set_default_subparser(DEFAULT_SUBCOMMAND)
 
   if error is not None:
     return None, error
@@ -97,7 +117,7 @@ def create_parser():
 
 
 def verify_args(args):
-  return TORQ_COMMANDS[args.subcommands]['verify'](args)
+  return get_command_function(args.subcommands, 'verify')(args)
 
 
 def is_device_required(args):
@@ -105,7 +125,7 @@ def is_device_required(args):
 
 
 def execute_command(args, device):
-  return TORQ_COMMANDS[args.subcommands]['execute'](args, device)
+  return get_command_function(args.subcommands, 'execute')(args, device)
 
 
 def print_error(error):
@@ -117,21 +137,25 @@ def print_error(error):
 def run():
   parser, error = create_parser()
   if error is not None:
-    print_error(error)
-    return
+    return print_error(error)
   args = parser.parse_args()
   if args.subcommands not in TORQ_COMMANDS:
     raise ValueError('Invalid command type used')
   args, error = verify_args(args)
   if error is not None:
-    print_error(error)
-    return
-  serial = args.serial[0] if args.serial else None
+    return print_error(error)
+  # Imported once the arguments are valid, so --help and argument errors
+  # never load the adb layer.
+  from .device import get_device
+  serial_arg = args.serial
+  serial = serial_arg[0] if serial_arg else None
   device, error = get_device(serial, is_device_required(args))
   if error is not None:
-    print_error(error)
-    return
-  error = execute_command(args, device)
+    return print_error(error)
+  try:
+    error = execute_command(args, device)
+  finally:
+    if device is not None:
+      device.close()
   if error is not None:
-    print_error(error)
-    return
+    return print_error(error)
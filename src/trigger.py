@@ -31,5 +31,6 @@ def verify_trigger_args(args):
 
 
 def execute_trigger_command(args, device):
-  assert device is not None, "device cannot be None"
+  if device is None:
+    raise TypeError("device cannot be None")
   return device.trigger_perfetto(args.trigger_name)
@@ -201,13 +201,17 @@ def configure_execute(args):
     primary_device, error = get_device(serial, True)
     if error is not None:
       return error
-    primary_device.root_device()
-    relay_prod_port = DEFAULT_VSOCK_ADDR if "vsock" in net_addr else DEFAULT_IP_ADDR
-    if args.primary_addr:
-      relay_prod_port = relay_prod_port.replace(DEFAULT_COMMS_PORT,
-                                                extract_port(net_addr))
-    command = VmCommand('relay-producer', 'enable', None, relay_prod_port)
-    if (error := relay_producer_execute(command, primary_device, machine_name)):
+    try:
+      primary_device.root_device()
+      relay_prod_port = DEFAULT_VSOCK_ADDR if "vsock" in net_addr else DEFAULT_IP_ADDR
+      if args.primary_addr:
+        relay_prod_port = relay_prod_port.replace(DEFAULT_COMMS_PORT,
+                                                  extract_port(net_addr))
+      command = VmCommand('relay-producer', 'enable', None, relay_prod_port)
+      error = relay_producer_execute(command, primary_device, machine_name)
+    finally:
+      primary_device.close()
+    if error:
       return error
 
   for secondary in args.secondary:
@@ -215,57 +219,75 @@ def configure_execute(args):
     secondary_device, error = get_device(serial, True)
     if error is not None:
       return error
-    secondary_device.root_device()
-    if machine_name is not None:
-      secondary_device.set_prop(TRACED_MACHINE_NAME_PROP, machine_name)
-    command = VmCommand('traced-relay', 'enable', net_addr, None)
-    if (error := traced_relay_execute(command, secondary_device)):
+    try:
+      secondary_device.root_device()
+      command = VmCommand('traced-relay', 'enable', net_addr, None)
+      error = traced_relay_execute(command, secondary_device, machine_name)
+    finally:
+      secondary_device.close()
+    if error:
       return error
   return None
 
 
-def traced_relay_execute(command, device):
+def traced_relay_execute(command, device, machine_name=None):
   if command.subcommand == 'enable':
+    # All props are set by a single adb shell command, in order.
+    props = []
+    if machine_name is not None:
+      props.append((TRACED_MACHINE_NAME_PROP, machine_name))
     if len(device.get_prop(TRACED_HYPERVISOR_PROP)) == 0:
       # Traced_relay can only be used in virtualized environments,
       # therefore set the |TRACED_HYPERVISOR_PROP| to true if
       # enabling traced_relay.
       print(f"Setting sysprop \"{TRACED_HYPERVISOR_PROP}\" to \"true\"")
-      device.set_prop(TRACED_HYPERVISOR_PROP, "true")
-    device.set_prop(TRACED_RELAY_PORT_PROP, command.relay_port)
-    device.set_prop(TRACED_ENABLE_PROP, "2")
+      props.append((TRACED_HYPERVISOR_PROP, "true"))
+    props.append((TRACED_RELAY_PORT_PROP, command.relay_port))
+    props.append((TRACED_ENABLE_PROP, "2"))
+    device.set_props(props)
   else:  # disable
     device.set_prop(TRACED_ENABLE_PROP, "1")
   return None
 
 
 def relay_producer_execute(command, device, machine_name=None):
-  device.set_prop(TRACED_ENABLE_PROP, "0")
-
   if command.subcommand == 'enable':
+    # Traced is disabled while its relay producer port changes. All props are
+    # set by a single adb shell command, in order.
+    props = [(TRACED_ENABLE_PROP, "0")]
     if machine_name is not None:
-      device.set_prop(TRACED_MACHINE_NAME_PROP, machine_name)
-    device.set_prop(TRACED_RELAY_PRODUCER_PORT_PROP, command.relay_prod_port)
+      props.append((TRACED_MACHINE_NAME_PROP, machine_name))
+    props.append((TRACED_RELAY_PRODUCER_PORT_PROP, command.relay_prod_port))
+    props.append((TRACED_ENABLE_PROP, "1"))
+    device.set_props(props)
   else:  #disable
+    device.set_prop(TRACED_ENABLE_PROP, "0")
     device.clear_prop(TRACED_RELAY_PRODUCER_PORT_PROP)
-
-  device.set_prop(TRACED_ENABLE_PROP, "1")
+    device.set_prop(TRACED_ENABLE_PROP, "1")
   return None
 
 
 def execute_vm_command(args, device):
   command = create_vm_command(args)
-  if command.type != 'configure':
-    if device is None:
-      # Done to extract the error message
-      serial = args.serial[0] if args.serial else None
-      device, error = get_device(serial, True)
-      if error is not None:
-        return error
-    device.root_device()
+  if command.type == 'configure':
+    return configure_execute(args)
+  if device is not None:
+    return execute_device_vm_command(command, device)
+  # Done to extract the error message
+  serial = args.serial[0] if args.serial else None
+  device, error = get_device(serial, True)
+  if error is not None:
+    return error
+  # Only the device created here is closed, the caller closes its own.
+  try:
+    return execute_device_vm_command(command, device)
+  finally:
+    device.close()
+
+
+def execute_device_vm_command(command, device):
+  device.root_device()
   match command.type:
-    case 'configure':
-      return configure_execute(args)
     case 'relay-producer':
       return relay_producer_execute(command, device)
     case 'traced-relay':
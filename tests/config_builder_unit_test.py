@@ -21,7 +21,8 @@ import sys
 import unittest
 from unittest import mock
 from src.config_builder import (build_default_config, build_custom_config,
-                                build_lightweight_config, build_memory_config)
+                                build_lightweight_config, build_memory_config,
+                                strip_heredoc)
 from src.profiler import DEFAULT_DUR_MS, ProfilerCommand
 from tests.test_utils import generate_mock_completed_process, run_cli
 
@@ -795,6 +796,15 @@ class ConfigBuilderUnitTest(unittest.TestCase):
         (f"<<EOF\n\n{CUSTOM_CONFIG_9000_DUR_MS_WITH_WHITE_SPACE}\n\n\nEOF"))
     self.assertEqual(self.command.dur_ms, TEST_DUR_MS)
 
+  @mock.patch("builtins.open",
+              mock.mock_open(read_data=CUSTOM_CONFIG_9000_DUR_MS))
+  def test_strip_heredoc_of_custom_config(self):
+    config, error = build_custom_config(self.command)
+
+    self.assertEqual(error, None)
+    self.assertEqual(
+        strip_heredoc(config), f"\n\n{CUSTOM_CONFIG_9000_DUR_MS}\n\n\n")
+
   @mock.patch("builtins.open",
               mock.mock_open(read_data=CUSTOM_CONFIG_INVALID_DUR_MS))
   def test_build_custom_config_extracting_invalid_dur_ms_error(self):
@@ -837,7 +847,7 @@ class ConfigBuilderUnitTest(unittest.TestCase):
                       (self.command.perfetto_config, TEST_FAILURE_MSG)))
     self.assertEqual(error.suggestion, None)
 
-  @mock.patch.object(subprocess, "run", autospec=True)
+  @mock.patch.object(subprocess, "run")
   def test_config_show_trigger_config(self, mock_subprocess_run):
     mock_subprocess_run.return_value = generate_mock_completed_process()
     terminal_output = io.StringIO()
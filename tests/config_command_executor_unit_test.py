@@ -15,9 +15,9 @@
 #
 
 import builtins
+import contextlib
 import unittest
 import subprocess
-import sys
 import io
 from pathlib import Path
 from unittest import mock
@@ -31,46 +31,48 @@ TEST_VALIDATION_ERROR = ValidationError(TEST_ERROR_MSG, None)
 TEST_SERIAL = "test-serial"
 ANDROID_SDK_VERSION_S = 32
 ANDROID_SDK_VERSION_T = 33
+TEST_CONFIG_SAVED_MSG = "The config has been saved to '%s'.\n"
+TEST_CONFIG_LIST_OUTPUT = "%s\n" % "\n".join(PREDEFINED_PERFETTO_CONFIGS)
 
-TEST_DEFAULT_CONFIG = f'''\
-buffers: {{
+TEST_DEFAULT_CONFIG = '''\
+buffers: {
   size_kb: 4096
   fill_policy: RING_BUFFER
-}}
-buffers {{
+}
+buffers {
   size_kb: 4096
   fill_policy: RING_BUFFER
-}}
-buffers: {{
+}
+buffers: {
   size_kb: 260096
   fill_policy: RING_BUFFER
-}}
-data_sources: {{
-  config {{
+}
+data_sources: {
+  config {
     name: "linux.process_stats"
-    process_stats_config {{
+    process_stats_config {
       scan_all_processes_on_start: true
-    }}
-  }}
-}}
-data_sources: {{
-  config {{
+    }
+  }
+}
+data_sources: {
+  config {
     name: "android.log"
-    android_log_config {{
+    android_log_config {
       min_prio: PRIO_VERBOSE
-    }}
-  }}
-}}
-data_sources {{
-  config {{
+    }
+  }
+}
+data_sources {
+  config {
     name: "android.packages_list"
-  }}
-}}
-data_sources: {{
-  config {{
+  }
+}
+data_sources: {
+  config {
     name: "linux.sys_stats"
     target_buffer: 1
-    sys_stats_config {{
+    sys_stats_config {
       stat_period_ms: 500
       stat_counters: STAT_CPU_TIMES
       stat_counters: STAT_FORK_COUNT
@@ -101,20 +103,20 @@ data_sources: {{
       vmstat_counters: VMSTAT_PGSTEAL_KSWAPD
       vmstat_counters: VMSTAT_WORKINGSET_REFAULT
       cpufreq_period_ms: 500
-    }}
-  }}
-}}
-data_sources: {{
-  config {{
+    }
+  }
+}
+data_sources: {
+  config {
     name: "android.surfaceflinger.frametimeline"
     target_buffer: 2
-  }}
-}}
-data_sources: {{
-  config {{
+  }
+}
+data_sources: {
+  config {
     name: "linux.ftrace"
     target_buffer: 2
-    ftrace_config {{
+    ftrace_config {
       ftrace_events: "dmabuf_heap/dma_heap_stat"
       ftrace_events: "ftrace/print"
       ftrace_events: "gpu_mem/gpu_mem_total"
@@ -171,67 +173,67 @@ data_sources: {{
       buffer_size_kb: 16384
       drain_period_ms: 150
       symbolize_ksyms: true
-    }}
-  }}
-}}
+    }
+  }
+}
 
-data_sources {{
-  config {{
+data_sources {
+  config {
     name: "perfetto.metatrace"
     target_buffer: 2
-  }}
+  }
   producer_name_filter: "perfetto.traced_probes"
-}}
+}
 
 write_into_file: true
 file_write_period_ms: 5000
 max_file_size_bytes: 100000000000
 flush_period_ms: 5000
-incremental_state_config {{
+incremental_state_config {
   clear_period_ms: 5000
-}}
+}
 
 '''
 
-TEST_DEFAULT_CONFIG_OLD_ANDROID = f'''\
-buffers: {{
+TEST_DEFAULT_CONFIG_OLD_ANDROID = '''\
+buffers: {
   size_kb: 4096
   fill_policy: RING_BUFFER
-}}
-buffers {{
+}
+buffers {
   size_kb: 4096
   fill_policy: RING_BUFFER
-}}
-buffers: {{
+}
+buffers: {
   size_kb: 260096
   fill_policy: RING_BUFFER
-}}
-data_sources: {{
-  config {{
+}
+data_sources: {
+  config {
     name: "linux.process_stats"
-    process_stats_config {{
+    process_stats_config {
       scan_all_processes_on_start: true
-    }}
-  }}
-}}
-data_sources: {{
-  config {{
+    }
+  }
+}
+data_sources: {
+  config {
     name: "android.log"
-    android_log_config {{
+    android_log_config {
       min_prio: PRIO_VERBOSE
-    }}
-  }}
-}}
-data_sources {{
-  config {{
+    }
+  }
+}
+data_sources {
+  config {
     name: "android.packages_list"
-  }}
-}}
-data_sources: {{
-  config {{
+  }
+}
+data_sources: {
+  config {
     name: "linux.sys_stats"
     target_buffer: 1
-    sys_stats_config {{
+    sys_stats_config {
       stat_period_ms: 500
       stat_counters: STAT_CPU_TIMES
       stat_counters: STAT_FORK_COUNT
@@ -262,20 +264,20 @@ data_sources: {{
       vmstat_counters: VMSTAT_PGSTEAL_KSWAPD
       vmstat_counters: VMSTAT_WORKINGSET_REFAULT
 
-    }}
-  }}
-}}
-data_sources: {{
-  config {{
+    }
+  }
+}
+data_sources: {
+  config {
     name: "android.surfaceflinger.frametimeline"
     target_buffer: 2
-  }}
-}}
-data_sources: {{
-  config {{
+  }
+}
+data_sources: {
+  config {
     name: "linux.ftrace"
     target_buffer: 2
-    ftrace_config {{
+    ftrace_config {
       ftrace_events: "dmabuf_heap/dma_heap_stat"
       ftrace_events: "ftrace/print"
       ftrace_events: "gpu_mem/gpu_mem_total"
@@ -332,25 +334,25 @@ data_sources: {{
       buffer_size_kb: 16384
       drain_period_ms: 150
       symbolize_ksyms: true
-    }}
-  }}
-}}
+    }
+  }
+}
 
-data_sources {{
-  config {{
+data_sources {
+  config {
     name: "perfetto.metatrace"
     target_buffer: 2
-  }}
+  }
   producer_name_filter: "perfetto.traced_probes"
-}}
+}
 
 write_into_file: true
 file_write_period_ms: 5000
 max_file_size_bytes: 100000000000
 flush_period_ms: 5000
-incremental_state_config {{
+incremental_state_config {
   clear_period_ms: 5000
-}}
+}
 
 '''
 
@@ -359,28 +361,26 @@ class ConfigCommandExecutorUnitTest(unittest.TestCase):
 
   def setUp(self):
     self.maxDiff = None
-    self.mock_get_device_patcher = mock.patch("src.torq.get_device")
-    self.mock_get_device = self.mock_get_device_patcher.start()
-    self.mock_device = mock.create_autospec(AndroidDevice, instance=True)
+    mock_get_device_patcher = mock.patch("src.device.get_device")
+    self.mock_get_device = mock_get_device_patcher.start()
+    self.addCleanup(mock_get_device_patcher.stop)
+    self.mock_device = mock.MagicMock(spec_set=AndroidDevice)
     self.mock_get_device.return_value = (self.mock_device, None)
     self.mock_device.get_android_sdk_version.return_value = (
         ANDROID_SDK_VERSION_T)
 
-    self.stdout_output = io.StringIO()
-    self.stderr_output = io.StringIO()
-    sys.stdout = self.stdout_output
-    sys.stderr = self.stderr_output
-
-  def tearDown(self):
-    self.mock_get_device_patcher.stop()
+    stack = contextlib.ExitStack()
+    self.addCleanup(stack.close)
+    self.stdout_output = stack.enter_context(
+        contextlib.redirect_stdout(io.StringIO()))
+    self.stderr_output = stack.enter_context(
+        contextlib.redirect_stderr(io.StringIO()))
 
   def test_config_list(self):
     run_cli("torq config list")
 
     self.assertEqual(self.stderr_output.getvalue(), "")
-    self.assertEqual(
-        self.stdout_output.getvalue(),
-        ("%s\n" % "\n".join(list(PREDEFINED_PERFETTO_CONFIGS.keys()))))
+    self.assertEqual(self.stdout_output.getvalue(), TEST_CONFIG_LIST_OUTPUT)
 
   def test_config_show(self):
     run_cli("torq config show default")
@@ -388,7 +388,7 @@ class ConfigCommandExecutorUnitTest(unittest.TestCase):
     self.assertEqual(self.stderr_output.getvalue(), "")
     self.assertEqual(self.stdout_output.getvalue(), TEST_DEFAULT_CONFIG)
 
-  @mock.patch.object(subprocess, "run", autospec=True)
+  @mock.patch.object(subprocess, "run")
   def test_config_show_no_device_connected(self, mock_subprocess_run):
     self.mock_get_device.return_value = (None, None)
 
@@ -397,7 +397,7 @@ class ConfigCommandExecutorUnitTest(unittest.TestCase):
     self.assertEqual(self.stderr_output.getvalue(), "")
     self.assertEqual(self.stdout_output.getvalue(), TEST_DEFAULT_CONFIG)
 
-  @mock.patch.object(subprocess, "run", autospec=True)
+  @mock.patch.object(subprocess, "run")
   def test_config_show_old_android_version(self, mock_subprocess_run):
     mock_subprocess_run.return_value = (
         generate_adb_devices_result(["test-serial"]))
@@ -411,7 +411,7 @@ class ConfigCommandExecutorUnitTest(unittest.TestCase):
     self.assertEqual(self.stdout_output.getvalue(),
                      TEST_DEFAULT_CONFIG_OLD_ANDROID)
 
-  @mock.patch.object(subprocess, "run", autospec=True)
+  @mock.patch.object(subprocess, "run")
   def test_config_pull(self, mock_subprocess_run):
     mock_subprocess_run.return_value = generate_mock_completed_process()
 
@@ -419,9 +419,9 @@ class ConfigCommandExecutorUnitTest(unittest.TestCase):
 
     self.assertEqual(self.stderr_output.getvalue(), "")
     self.assertEqual(self.stdout_output.getvalue(),
-                     "The config has been saved to 'default.txtpb'.\n")
+                     TEST_CONFIG_SAVED_MSG % "default.txtpb")
 
-  @mock.patch.object(subprocess, "run", autospec=True)
+  @mock.patch.object(subprocess, "run")
   def test_config_pull_no_device_connected(self, mock_subprocess_run):
     mock_subprocess_run.return_value = generate_mock_completed_process()
     self.mock_get_device.return_value = (None, None)
@@ -430,9 +430,9 @@ class ConfigCommandExecutorUnitTest(unittest.TestCase):
 
     self.assertEqual(self.stderr_output.getvalue(), "")
     self.assertEqual(self.stdout_output.getvalue(),
-                     "The config has been saved to 'default.txtpb'.\n")
+                     TEST_CONFIG_SAVED_MSG % "default.txtpb")
 
-  @mock.patch.object(subprocess, "run", autospec=True)
+  @mock.patch.object(subprocess, "run")
   def test_config_pull_old_android_version(self, mock_subprocess_run):
     self.mock_device.get_android_sdk_version.return_value = (
         ANDROID_SDK_VERSION_S)
@@ -442,10 +442,10 @@ class ConfigCommandExecutorUnitTest(unittest.TestCase):
 
     self.assertEqual(self.stderr_output.getvalue(), "")
     self.assertEqual(self.stdout_output.getvalue(),
-                     "The config has been saved to 'default.txtpb'.\n")
+                     TEST_CONFIG_SAVED_MSG % "default.txtpb")
 
   @mock.patch.object(Path, "exists", autospec=True)
-  @mock.patch.object(subprocess, "run", autospec=True)
+  @mock.patch.object(subprocess, "run")
   def test_config_pull_nonexistent_filepath(self, mock_subprocess_run,
                                             mock_exists):
     mock_subprocess_run.return_value = generate_mock_completed_process()
@@ -455,11 +455,11 @@ class ConfigCommandExecutorUnitTest(unittest.TestCase):
 
     self.assertEqual(self.stderr_output.getvalue(), "")
     self.assertEqual(self.stdout_output.getvalue(),
-                     "The config has been saved to 'new_config.txtpb'.\n")
+                     TEST_CONFIG_SAVED_MSG % "new_config.txtpb")
 
   @mock.patch.object(Path, "exists", autospec=True)
   @mock.patch.object(builtins, "input")
-  @mock.patch.object(subprocess, "run", autospec=True)
+  @mock.patch.object(subprocess, "run")
   def test_config_pull_overwriting_existing_filepath(self, mock_subprocess_run,
                                                      mock_input, mock_exists):
     mock_subprocess_run.return_value = generate_mock_completed_process()
@@ -470,7 +470,7 @@ class ConfigCommandExecutorUnitTest(unittest.TestCase):
 
     self.assertEqual(self.stderr_output.getvalue(), "")
     self.assertEqual(self.stdout_output.getvalue(),
-                     "The config has been saved to 'config.txtpb'.\n")
+                     TEST_CONFIG_SAVED_MSG % "config.txtpb")
 
   @mock.patch.object(Path, "exists", autospec=True)
   @mock.patch.object(builtins, "input")
@@ -497,7 +497,7 @@ class ConfigCommandExecutorUnitTest(unittest.TestCase):
         "File path 'config.txtpb' is a directory.\nSuggestion:\n\tProvide a path to a file.\n"
     )
 
-  @mock.patch.object(subprocess, "run", autospec=True)
+  @mock.patch.object(subprocess, "run")
   def test_config_pull_custom_filepath_with_no_suffix(self,
                                                       mock_subprocess_run):
     mock_subprocess_run.return_value = generate_mock_completed_process()
@@ -506,7 +506,7 @@ class ConfigCommandExecutorUnitTest(unittest.TestCase):
 
     self.assertEqual(self.stderr_output.getvalue(), "")
     self.assertEqual(self.stdout_output.getvalue(),
-                     "The config has been saved to 'config.txtpb'.\n")
+                     TEST_CONFIG_SAVED_MSG % "config.txtpb")
 
   def test_config_pull_invalid_custom_filepath_suffix(self):
     run_cli("torq config pull default config.badsuffix")
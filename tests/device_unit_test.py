@@ -15,15 +15,22 @@
 #
 
 import builtins
-import unittest
+import contextlib
 import os
+import shlex
+import unittest
 import subprocess
+import sys
+import time
 from unittest import mock
-from src.device import AndroidDevice
+from src import device as device_module
+from src.device import (AndroidDevice, BOOT_COMPLETED_TIME_OUT_SECS,
+                        USER_INFO_SEPARATOR)
 from src.profiler import ProfilerCommand
 from src.shell import AdbShell
 from src.utils import ShellExitCodes
-from tests.test_utils import generate_adb_devices_result, generate_mock_completed_process
+from tests.test_utils import (android_serial, generate_adb_devices_result,
+                              generate_mock_completed_process, parameterized)
 
 TEST_DEVICE_SERIAL = "test-device-serial"
 TEST_DEVICE_SERIAL2 = "test-device-serial2"
@@ -41,42 +48,110 @@ TEST_PROP_VALUE = "test-prop-value"
 TEST_PID_OUTPUT = b"8241\n"
 BOOT_COMPLETE_OUTPUT = b"1\n"
 ANDROID_SDK_VERSION_T = 33
+TEST_USERS_STDOUT = (b'Users:\n\tUserInfo{%d:Driver:813}'
+                     b' running\n\tUserInfo{%d:Driver:412}\n' %
+                     (TEST_USER_ID_1, TEST_USER_ID_2))
+TEST_PACKAGES_STDOUT = (
+    b'package:%b\npackage:%b\n' %
+    (TEST_PACKAGE_1.encode("utf-8"), TEST_PACKAGE_2.encode("utf-8")))
+# Non-persistent shells hold no state, so the tests can share one.
+TEST_SHELL = AdbShell(TEST_DEVICE_SERIAL)
+TEST_SIMPLEPERF_COMMAND = ProfilerCommand("profiler", "custom", None, None,
+                                          10000, None, None, ("cpu-cycles",),
+                                          None, None, None, None, None, None,
+                                          None, None, None, None, None, None,
+                                          None)
+TEST_SIMPLEPERF_LIST_STDOUT = (b'List of software events:\n  alignment-faults\n'
+                               b'  context-switches\n  cpu-clock\n'
+                               b'  cpu-migrations\n  emulation-faults\n'
+                               b'  major-faults\n  minor-faults\n'
+                               b'  page-faults\n  task-clock')
+TEST_NO_DEVICES_MSG = "There are currently no devices connected."
+TEST_ADB_NOT_FOUND_MSG = "adb could not be found on the host device."
+TEST_USER_NOT_EXIST_MSG = (
+    "User ID %s does not exist on device with serial %s." %
+    (TEST_USER_ID_3, TEST_DEVICE_SERIAL))
+TEST_USER_NOT_EXIST_SUGGESTION = (
+    "Select from one of the following user IDs on device with serial %s: %s, %s"
+    % (TEST_DEVICE_SERIAL, TEST_USER_ID_1, TEST_USER_ID_2))
+TEST_SERVICE_PACKAGE_MSG = (
+    "Cannot start package %s on device with serial %s because %s is a service"
+    " package, which doesn't implement a MAIN activity." %
+    (TEST_PACKAGE_1, TEST_DEVICE_SERIAL, TEST_PACKAGE_1))
+TEST_ROOT_TIMEOUT_MSG = ("Device with serial %s took too long to reconnect"
+                         " after being rooted." % TEST_DEVICE_SERIAL)
+TEST_REBOOT_START_TIMEOUT_MSG = (
+    "Device with serial %s took too long to start rebooting." %
+    TEST_DEVICE_SERIAL)
+TEST_SHELL_EXITED_MSG = (
+    "adb shell on device with serial %s exited unexpectedly." %
+    TEST_DEVICE_SERIAL)
+TEST_REBOOT_RECONNECT_TIMEOUT_MSG = (
+    "Device with serial %s took too long to reconnect after rebooting." %
+    TEST_DEVICE_SERIAL)
+TEST_REBOOT_FINISH_TIMEOUT_MSG = (
+    "Device with serial %s took too long to finish rebooting." %
+    TEST_DEVICE_SERIAL)
 
 
 class DeviceUnitTest(unittest.TestCase):
 
-  @staticmethod
-  def subprocess_output(first_return_value, polling_return_value):
-    # Mocking the return value of a call to adb root and the return values of
-    # many followup calls to adb devices
-    yield first_return_value
-    while True:
-      yield polling_return_value
+  @classmethod
+  def setUpClass(cls):
+    # The code under test only reads these, so they are shared by the tests.
+    cls.empty_output = subprocess.CompletedProcess(
+        args=[], returncode=0, stdout=b"\n", stderr=b"\n")
+    cls.users_output = cls.mock_users()
+    # 'adb get-state' of a device that went away.
+    cls.disconnected_output = subprocess.CompletedProcess(
+        args=[],
+        returncode=ShellExitCodes.EX_FAILURE.value,
+        stdout=b"",
+        stderr=b"error: device '%s' not found\n" %
+        TEST_DEVICE_SERIAL.encode("utf-8"))
+    cls.packages_output = cls.mock_packages()
+    cls.simpleperf_list_output = subprocess.CompletedProcess(
+        args=[], returncode=0, stdout=TEST_SIMPLEPERF_LIST_STDOUT)
+    cls.one_device_output = generate_adb_devices_result([TEST_DEVICE_SERIAL])
+    cls.two_devices_output = generate_adb_devices_result(
+        [TEST_DEVICE_SERIAL, TEST_DEVICE_SERIAL2])
+    cls.two_devices_adb_not_started_output = generate_adb_devices_result(
+        [TEST_DEVICE_SERIAL, TEST_DEVICE_SERIAL2], False)
+    cls.no_devices_output = generate_adb_devices_result([])
+    cls.no_devices_adb_not_started_output = generate_adb_devices_result([],
+                                                                        False)
+    # Patched once for the class without autospec, since the tests only set
+    # return values and check the commands run. setUp resets them.
+    stack = contextlib.ExitStack()
+    cls.addClassCleanup(stack.close)
+    cls.mock_run = stack.enter_context(mock.patch.object(subprocess, "run"))
+    cls.mock_popen = stack.enter_context(mock.patch.object(subprocess, "Popen"))
+    # Host-side polling must never make these tests wait.
+    stack.enter_context(mock.patch.object(time, "sleep", return_value=None))
+
+  def setUp(self):
+    AdbShell.invalidate_devices_cache()
+    self.mock_run.reset_mock(return_value=True, side_effect=True)
+    self.mock_popen.reset_mock(return_value=True, side_effect=True)
 
   @staticmethod
   def mock_users(returncode=0):
-    return mock.create_autospec(
-        subprocess.CompletedProcess,
-        instance=True,
-        stdout=(b'Users:\n\tUserInfo{%d:Driver:813}'
-                b' running\n\tUserInfo{%d:Driver:412}\n' %
-                (TEST_USER_ID_1, TEST_USER_ID_2)),
-        returncode=returncode)
+    return subprocess.CompletedProcess(
+        args=["adb", "-s", TEST_DEVICE_SERIAL, "shell", "pm", "list", "users"],
+        returncode=returncode,
+        stdout=TEST_USERS_STDOUT)
 
   @staticmethod
   def mock_packages(returncode=0):
-    return mock.create_autospec(
-        subprocess.CompletedProcess,
-        instance=True,
-        stdout=(
-            b'package:%b\npackage:%b\n' %
-            (TEST_PACKAGE_1.encode("utf-8"), TEST_PACKAGE_2.encode("utf-8"))),
-        returncode=returncode)
-
-  @mock.patch.object(subprocess, "run", autospec=True)
-  def test_get_adb_devices_returns_devices(self, mock_subprocess_run):
-    mock_subprocess_run.return_value = (
-        generate_adb_devices_result([TEST_DEVICE_SERIAL, TEST_DEVICE_SERIAL2]))
+    return subprocess.CompletedProcess(
+        args=[
+            "adb", "-s", TEST_DEVICE_SERIAL, "shell", "pm", "list", "packages"
+        ],
+        returncode=returncode,
+        stdout=TEST_PACKAGES_STDOUT)
+
+  def test_get_adb_devices_returns_devices(self):
+    self.mock_run.return_value = self.two_devices_output
 
     devices = AdbShell.get_adb_devices()
 
@@ -84,12 +159,8 @@ class DeviceUnitTest(unittest.TestCase):
     self.assertEqual(devices[0], TEST_DEVICE_SERIAL)
     self.assertEqual(devices[1], TEST_DEVICE_SERIAL2)
 
-  @mock.patch.object(subprocess, "run", autospec=True)
-  def test_get_adb_devices_returns_devices_and_adb_not_started(
-      self, mock_subprocess_run):
-    mock_subprocess_run.return_value = (
-        generate_adb_devices_result([TEST_DEVICE_SERIAL, TEST_DEVICE_SERIAL2],
-                                    False))
+  def test_get_adb_devices_returns_devices_and_adb_not_started(self):
+    self.mock_run.return_value = self.two_devices_adb_not_started_output
 
     devices = AdbShell.get_adb_devices()
 
@@ -97,759 +168,571 @@ class DeviceUnitTest(unittest.TestCase):
     self.assertEqual(devices[0], TEST_DEVICE_SERIAL)
     self.assertEqual(devices[1], TEST_DEVICE_SERIAL2)
 
-  @mock.patch.object(subprocess, "run", autospec=True)
-  def test_get_adb_devices_returns_no_device(self, mock_subprocess_run):
-    mock_subprocess_run.return_value = generate_adb_devices_result([])
+  def test_get_adb_devices_returns_no_device(self):
+    self.mock_run.return_value = self.no_devices_output
 
     devices = AdbShell.get_adb_devices()
 
     self.assertEqual(devices, [])
 
-  @mock.patch.object(subprocess, "run", autospec=True)
-  def test_get_adb_devices_returns_no_device_and_adb_not_started(
-      self, mock_subprocess_run):
-    mock_subprocess_run.return_value = (generate_adb_devices_result([], False))
+  def test_get_adb_devices_returns_no_device_and_adb_not_started(self):
+    self.mock_run.return_value = self.no_devices_adb_not_started_output
 
     devices = AdbShell.get_adb_devices()
 
     self.assertEqual(devices, [])
 
-  @mock.patch.object(subprocess, "run", autospec=True)
-  def test_get_adb_devices_command_failure_error(self, mock_subprocess_run):
-    mock_subprocess_run.side_effect = TEST_EXCEPTION
-
-    with self.assertRaises(Exception) as e:
-      AdbShell.get_adb_devices()
-
-    self.assertEqual(str(e.exception), TEST_FAILURE_MSG)
+  def test_get_adb_devices_skips_devices_not_ready(self):
+    self.mock_run.return_value = subprocess.CompletedProcess(
+        args=["adb", "devices"],
+        returncode=0,
+        stdout=(b"List of devices attached\n%s\tunauthorized\n\n%s\tdevice"
+                b"\n\n" % (TEST_DEVICE_SERIAL.encode("utf-8"),
+                           TEST_DEVICE_SERIAL2.encode("utf-8"))))
 
-  @mock.patch.object(subprocess, "run", autospec=True)
-  def test_verify_serial_arg_in_devices(self, mock_subprocess_run):
-    mock_subprocess_run.return_value = (
-        generate_adb_devices_result([TEST_DEVICE_SERIAL]))
-
-    error = AdbShell.verify_serial(TEST_DEVICE_SERIAL)
-
-    self.assertEqual(error, None)
+    devices = AdbShell.get_adb_devices()
 
-  @mock.patch.object(subprocess, "run", autospec=True)
-  def test_verify_serial_arg_not_in_devices_error(self, mock_subprocess_run):
-    mock_subprocess_run.return_value = (
-        generate_adb_devices_result([TEST_DEVICE_SERIAL]))
+    self.assertEqual(devices, [TEST_DEVICE_SERIAL2])
 
-    error = AdbShell.verify_serial("invalid-device-serial")
+  def test_get_adb_devices_reuses_cached_devices(self):
+    self.mock_run.return_value = self.one_device_output
 
-    self.assertNotEqual(error, None)
-    self.assertEqual(
-        error.message,
-        "Device with serial invalid-device-serial is not connected.")
-    self.assertEqual(error.suggestion, None)
-
-  @mock.patch.dict(
-      os.environ, {"ANDROID_SERIAL": TEST_DEVICE_SERIAL}, clear=True)
-  @mock.patch.object(subprocess, "run", autospec=True)
-  def test_get_default_serial_env_variable_in_devices(self,
-                                                      mock_subprocess_run):
-    mock_subprocess_run.return_value = (
-        generate_adb_devices_result([TEST_DEVICE_SERIAL]))
-
-    serial, error = AdbShell.get_default_serial()
+    AdbShell.get_adb_devices()
+    devices = AdbShell.get_adb_devices()
 
-    self.assertEqual(error, None)
-    self.assertEqual(serial, TEST_DEVICE_SERIAL)
+    self.assertEqual(devices, [TEST_DEVICE_SERIAL])
+    self.assertEqual(self.mock_run.call_count, 1)
 
-  @mock.patch.dict(
-      os.environ, {"ANDROID_SERIAL": "invalid-device-serial"}, clear=True)
-  @mock.patch.object(subprocess, "run", autospec=True)
-  def test_get_default_serial_env_variable_not_in_devices_error(
-      self, mock_subprocess_run):
-    mock_subprocess_run.return_value = (
-        generate_adb_devices_result([TEST_DEVICE_SERIAL]))
+  def test_get_adb_devices_command_failure_error(self):
+    self.mock_run.side_effect = TEST_EXCEPTION
 
-    serial, error = AdbShell.get_default_serial()
+    with self.assertRaises(Exception) as e:
+      AdbShell.get_adb_devices()
 
-    self.assertEqual(serial, None)
-    self.assertNotEqual(error, None)
-    self.assertEqual(error.message, ("Device with serial invalid-device-serial"
-                                     " is set as environment variable,"
-                                     " ANDROID_SERIAL, but is not connected."))
-    self.assertEqual(error.suggestion, None)
+    self.assertEqual(str(e.exception), TEST_FAILURE_MSG)
 
-  @mock.patch.object(subprocess, "run", autospec=True)
-  def test_get_default_serial_adb_devices_command_fails_error(
-      self, mock_subprocess_run):
-    mock_subprocess_run.side_effect = TEST_EXCEPTION
+  def test_get_default_serial_adb_devices_command_fails_error(self):
+    self.mock_run.side_effect = TEST_EXCEPTION
 
     with self.assertRaises(Exception) as e:
       AdbShell.get_default_serial()
 
     self.assertEqual(str(e.exception), TEST_FAILURE_MSG)
 
-  @mock.patch.object(subprocess, "run", autospec=True)
-  def test_get_default_serial_no_devices_connected_error(
-      self, mock_subprocess_run):
-    mock_subprocess_run.return_value = generate_adb_devices_result([])
-
-    serial, error = AdbShell.get_default_serial()
-
-    self.assertEqual(serial, None)
-    self.assertNotEqual(error, None)
-    self.assertEqual(error.message, "There are currently no devices connected.")
-    self.assertEqual(error.suggestion, None)
-
-  @mock.patch.object(subprocess, "run", autospec=True)
-  def test_get_default_serial_no_devices_connected_adb_not_started_error(
-      self, mock_subprocess_run):
-    mock_subprocess_run.return_value = (generate_adb_devices_result([], False))
+  def test_get_default_serial_no_devices_connected_adb_not_started_error(self):
+    self.mock_run.return_value = self.no_devices_adb_not_started_output
 
     serial, error = AdbShell.get_default_serial()
 
-    self.assertEqual(serial, None)
-    self.assertNotEqual(error, None)
-    self.assertEqual(error.message, "There are currently no devices connected.")
-    self.assertEqual(error.suggestion, None)
+    self.assertIsNone(serial)
+    self.assertIsNotNone(error)
+    self.assertEqual(error.message, TEST_NO_DEVICES_MSG)
+    self.assertIsNone(error.suggestion)
 
-  @mock.patch.dict(os.environ, {}, clear=True)
-  @mock.patch.object(subprocess, "run", autospec=True)
-  def test_get_default_serial_only_one_device(self, mock_subprocess_run):
-    mock_subprocess_run.return_value = (
-        generate_adb_devices_result([TEST_DEVICE_SERIAL]))
-
-    serial, error = AdbShell.get_default_serial()
-
-    self.assertEqual(error, None)
-    self.assertEqual(serial, TEST_DEVICE_SERIAL)
-
-  @mock.patch.dict(os.environ, {}, clear=True)
-  @mock.patch.object(subprocess, "run", autospec=True)
-  @mock.patch.object(builtins, "input")
-  def test_get_default_serial_multiple_devices_select_first(
-      self, mock_input, mock_subprocess_run):
-    mock_input.return_value = "0"
-    mock_subprocess_run.return_value = (
-        generate_adb_devices_result([TEST_DEVICE_SERIAL, TEST_DEVICE_SERIAL2]))
-
-    serial, error = AdbShell.get_default_serial()
-
-    self.assertEqual(error, None)
-    self.assertEqual(serial, TEST_DEVICE_SERIAL)
-
-  @mock.patch.dict(os.environ, {}, clear=True)
-  @mock.patch.object(subprocess, "run", autospec=True)
-  @mock.patch.object(builtins, "input")
-  def test_get_default_serial_multiple_devices_select_second(
-      self, mock_input, mock_subprocess_run):
-    mock_input.return_value = "1"
-    mock_subprocess_run.return_value = (
-        generate_adb_devices_result([TEST_DEVICE_SERIAL, TEST_DEVICE_SERIAL2]))
-
-    serial, error = AdbShell.get_default_serial()
+  def test_root_device_success(self):
+    self.mock_run.side_effect = [
+        self.empty_output, self.disconnected_output, self.empty_output
+    ]
+    device = AndroidDevice(TEST_SHELL)
 
-    self.assertEqual(error, None)
-    self.assertEqual(serial, TEST_DEVICE_SERIAL2)
+    # No exception is expected to be thrown
+    device.root_device()
 
-  @mock.patch("src.shell.poll_is_task_completed", autospec=True)
-  @mock.patch.object(subprocess, "run", autospec=True)
-  def test_root_device_success(self, mock_subprocess_run,
-                               mock_poll_is_task_completed):
-    mock_subprocess_run.side_effect = [
-        generate_mock_completed_process(),
-        generate_adb_devices_result([TEST_DEVICE_SERIAL])
+    self.assertEqual([call.args[0] for call in self.mock_run.call_args_list],
+                     [["adb", "-s", TEST_DEVICE_SERIAL, "root"],
+                      ["adb", "-s", TEST_DEVICE_SERIAL, "get-state"],
+                      ["adb", "-s", TEST_DEVICE_SERIAL, "wait-for-device"]])
+    self.assertEqual(self.mock_run.call_args.kwargs["timeout"],
+                     BOOT_COMPLETED_TIME_OUT_SECS)
+
+  def test_root_device_already_root_skips_disconnect(self):
+    self.mock_run.side_effect = [
+        subprocess.CompletedProcess(
+            args=[], returncode=0, stdout=b"adbd is already running as root\n"),
+        self.empty_output
     ]
-    device = AndroidDevice(AdbShell(TEST_DEVICE_SERIAL))
-    mock_poll_is_task_completed.return_value = True
+    device = AndroidDevice(TEST_SHELL)
 
-    # No exception is expected to be thrown
     device.root_device()
 
-  @mock.patch.object(subprocess, "run", autospec=True)
-  def test_root_device_failure(self, mock_subprocess_run):
-    mock_subprocess_run.side_effect = TEST_EXCEPTION
-    device = AndroidDevice(AdbShell(TEST_DEVICE_SERIAL))
+    self.assertEqual(self.mock_run.call_count, 2)
+    self.assertEqual(self.mock_run.call_args.args[0],
+                     ["adb", "-s", TEST_DEVICE_SERIAL, "wait-for-device"])
+
+  @parameterized([("root_device", ()), ("remove_file", (TEST_FILE_PATH,)),
+                  ("ensure_removed", (TEST_FILE_PATH,)),
+                  ("pull_file", (TEST_FILE_PATH, TEST_FILE_PATH)),
+                  ("get_all_users", ()), ("user_exists", (TEST_USER_ID_1,)),
+                  ("get_user_info", ()), ("get_current_user", ()),
+                  ("perform_user_switch", (TEST_USER_ID_1,)),
+                  ("write_to_file", (TEST_FILE_PATH, TEST_STRING_FILE)),
+                  ("set_prop", (TEST_PROP, TEST_PROP_VALUE)),
+                  ("set_props", ([(TEST_PROP, TEST_PROP_VALUE)],)),
+                  ("reboot", ()), ("wait_for_device", ()),
+                  ("is_boot_completed", ()), ("wait_for_boot_to_complete", ()),
+                  ("get_packages", ()), ("get_pid", (TEST_PACKAGE_1,)),
+                  ("is_process_running", (TEST_PACKAGE_1,)),
+                  ("start_package", (TEST_PACKAGE_1,)),
+                  ("kill_process", (TEST_PACKAGE_1,)),
+                  ("force_stop_package", (TEST_PACKAGE_1,)),
+                  ("get_prop", (TEST_PROP,)), ("get_android_sdk_version", ())])
+  def test_run_command_failure_error(self, item):
+    method, args = item
+    self.mock_run.side_effect = TEST_EXCEPTION
+    device = AndroidDevice(TEST_SHELL)
 
     with self.assertRaises(Exception) as e:
-      device.root_device()
+      getattr(device, method)(*args)
 
     self.assertEqual(str(e.exception), TEST_FAILURE_MSG)
 
-  @mock.patch("src.shell.poll_is_task_completed", autospec=True)
-  @mock.patch.object(subprocess, "run", autospec=True)
-  def test_root_device_times_out_error(self, mock_subprocess_run,
-                                       mock_poll_is_task_completed):
-    mock_subprocess_run.return_value = generate_mock_completed_process()
-    device = AndroidDevice(AdbShell(TEST_DEVICE_SERIAL))
-    mock_poll_is_task_completed.return_value = False
+  def test_root_device_times_out_error(self):
+    self.mock_run.side_effect = [
+        self.empty_output, self.disconnected_output,
+        subprocess.TimeoutExpired("adb", BOOT_COMPLETED_TIME_OUT_SECS)
+    ]
+    device = AndroidDevice(TEST_SHELL)
 
     with self.assertRaises(Exception) as e:
       device.root_device()
 
-    self.assertEqual(
-        str(e.exception),
-        ("Device with serial %s took too long to"
-         " reconnect after being rooted." % TEST_DEVICE_SERIAL))
-
-  @mock.patch.object(subprocess, "run", autospec=True)
-  def test_root_device_and_adb_devices_fails_error(self, mock_subprocess_run):
-    mock_subprocess_run.side_effect = [
-        generate_mock_completed_process(), TEST_EXCEPTION
+    self.assertEqual(str(e.exception), TEST_ROOT_TIMEOUT_MSG)
+
+  def test_root_device_and_wait_for_device_fails_error(self):
+    self.mock_run.side_effect = [
+        self.empty_output, self.disconnected_output, TEST_EXCEPTION
     ]
-    device = AndroidDevice(AdbShell(TEST_DEVICE_SERIAL))
+    device = AndroidDevice(TEST_SHELL)
 
     with self.assertRaises(Exception) as e:
       device.root_device()
 
     self.assertEqual(str(e.exception), TEST_FAILURE_MSG)
 
-  @mock.patch.object(subprocess, "run", autospec=True)
-  def test_remove_file_success(self, mock_subprocess_run):
-    mock_subprocess_run.return_value = generate_mock_completed_process()
-    device = AndroidDevice(AdbShell(TEST_DEVICE_SERIAL))
+  def test_remove_file_success(self):
+    self.mock_run.return_value = self.empty_output
+    device = AndroidDevice(TEST_SHELL)
 
     # No exception is expected to be thrown
     device.remove_file(TEST_FILE_PATH)
 
-  @mock.patch.object(subprocess, "run", autospec=True)
-  def test_remove_file_failure(self, mock_subprocess_run):
-    mock_subprocess_run.side_effect = TEST_EXCEPTION
-    device = AndroidDevice(AdbShell(TEST_DEVICE_SERIAL))
+  def test_ensure_removed_success(self):
+    self.mock_run.return_value = self.empty_output
+    device = AndroidDevice(TEST_SHELL)
 
-    with self.assertRaises(Exception) as e:
-      device.remove_file(TEST_FILE_PATH)
-
-    self.assertEqual(str(e.exception), TEST_FAILURE_MSG)
+    removed = device.ensure_removed(TEST_FILE_PATH)
 
-  @mock.patch.object(subprocess, "Popen", autospec=True)
-  def test_start_perfetto_trace_success(self, mock_subprocess_popen):
-    # Mocking the return value of subprocess.Popen to ensure it's
-    # not modified and returned by AndroidDevice.start_perfetto_trace
-    mock_subprocess_popen.return_value = mock.Mock()
-    device = AndroidDevice(AdbShell(TEST_DEVICE_SERIAL))
+    self.assertEqual(removed, True)
+    self.assertEqual(self.mock_run.call_args.args[0], [
+        "adb", "-s", TEST_DEVICE_SERIAL, "shell", "rm", "-f", "--",
+        TEST_FILE_PATH
+    ])
 
-    mock_process = device.start_perfetto_trace("")
+  def test_ensure_removed_failure(self):
+    self.mock_run.return_value = generate_mock_completed_process(
+        returncode=ShellExitCodes.EX_FAILURE.value)
+    device = AndroidDevice(TEST_SHELL)
 
-    # No exception is expected to be thrown
-    self.assertEqual(mock_process, mock_subprocess_popen.return_value)
+    removed = device.ensure_removed(TEST_FILE_PATH)
 
-  @mock.patch.object(subprocess, "Popen", autospec=True)
-  def test_start_perfetto_trace_failure(self, mock_subprocess_popen):
-    mock_subprocess_popen.side_effect = TEST_EXCEPTION
-    device = AndroidDevice(AdbShell(TEST_DEVICE_SERIAL))
+    self.assertEqual(removed, False)
 
-    with self.assertRaises(Exception) as e:
-      device.start_perfetto_trace("")
+  def test_ensure_removed_with_suffixes_keeps_path_whole(self):
+    self.mock_run.return_value = self.empty_output
+    device = AndroidDevice(TEST_SHELL)
 
-    self.assertEqual(str(e.exception), TEST_FAILURE_MSG)
+    device.ensure_removed("/data/test dir/trace", with_suffixes=True)
 
-  @mock.patch.object(subprocess, "Popen", autospec=True)
-  def test_start_simpleperf_trace_success(self, mock_subprocess_popen):
-    # Mocking the return value of subprocess.Popen to ensure it's
-    # not modified and returned by AndroidDevice.start_simpleperf_trace
-    mock_subprocess_popen.return_value = mock.Mock()
-    device = AndroidDevice(AdbShell(TEST_DEVICE_SERIAL))
-    command = ProfilerCommand("profiler", "custom", None, None, 10000, None,
-                              None, ["cpu-cycles"], None, None, None, None,
-                              None, None, None, None, None, None, None, None,
-                              None)
-    mock_process = device.start_simpleperf_trace(command)
+    self.assertEqual(
+        self.mock_run.call_args.args[0][-4:],
+        ["sh", "-c", "'rm -f -- \"$0\"*'", "'/data/test dir/trace'"])
 
-    # No exception is expected to be thrown
-    self.assertEqual(mock_process, mock_subprocess_popen.return_value)
+  def test_remove_file_does_not_expand_glob(self):
+    self.mock_run.return_value = self.empty_output
+    device = AndroidDevice(TEST_SHELL)
 
-  @mock.patch.object(subprocess, "Popen", autospec=True)
-  def test_start_simpleperf_trace_failure(self, mock_subprocess_popen):
-    mock_subprocess_popen.side_effect = TEST_EXCEPTION
-    device = AndroidDevice(AdbShell(TEST_DEVICE_SERIAL))
-    command = ProfilerCommand("profiler", "custom", None, None, 10000, None,
-                              None, ["cpu-cycles"], None, None, None, None,
-                              None, None, None, None, None, None, None, None,
-                              None)
+    device.remove_file(TEST_FILE_PATH + "*")
 
-    with self.assertRaises(Exception) as e:
-      device.start_simpleperf_trace(command)
+    self.assertEqual(self.mock_run.call_args.args[0][-1],
+                     "'%s*'" % TEST_FILE_PATH)
 
-    self.assertEqual(str(e.exception), TEST_FAILURE_MSG)
+  def test_start_perfetto_trace_success(self):
+    # The return value of the patched subprocess.Popen is expected to be
+    # returned unmodified by AndroidDevice.start_perfetto_trace
+    device = AndroidDevice(TEST_SHELL)
 
-  @mock.patch.object(subprocess, "run", autospec=True)
-  def test_pull_file_success(self, mock_subprocess_run):
-    mock_subprocess_run.return_value = generate_mock_completed_process()
-    device = AndroidDevice(AdbShell(TEST_DEVICE_SERIAL))
+    mock_process = device.start_perfetto_trace("")
 
     # No exception is expected to be thrown
-    self.assertTrue(device.pull_file(TEST_FILE_PATH, TEST_FILE_PATH))
+    self.assertIs(mock_process, self.mock_popen.return_value)
 
-  @mock.patch.object(subprocess, "run", autospec=True)
-  def test_pull_file_failure(self, mock_subprocess_run):
-    mock_subprocess_run.side_effect = TEST_EXCEPTION
-    device = AndroidDevice(AdbShell(TEST_DEVICE_SERIAL))
+  def test_start_perfetto_trace_pipes_config_to_stdin(self):
+    device = AndroidDevice(TEST_SHELL)
+
+    device.start_perfetto_trace("\n\nduration_ms: 10000\n\n")
+
+    self.mock_popen.assert_called_once_with([
+        "adb", "-s", TEST_DEVICE_SERIAL, "shell", "perfetto", "-c", "-",
+        "--txt", "-o", "/data/misc/perfetto-traces/trace.perfetto-trace"
+    ],
+                                            stdin=subprocess.PIPE)
+    self.mock_popen.return_value.stdin.write.assert_called_once_with(
+        b"\n\nduration_ms: 10000\n\n")
+    self.mock_popen.return_value.stdin.close.assert_called_once()
+
+  @parameterized([("start_perfetto_trace", ("",)),
+                  ("start_simpleperf_trace", (TEST_SIMPLEPERF_COMMAND,))])
+  def test_start_trace_failure_error(self, item):
+    method, args = item
+    self.mock_popen.side_effect = TEST_EXCEPTION
+    device = AndroidDevice(TEST_SHELL)
 
     with self.assertRaises(Exception) as e:
-      device.pull_file(TEST_FILE_PATH, TEST_FILE_PATH)
+      getattr(device, method)(*args)
 
     self.assertEqual(str(e.exception), TEST_FAILURE_MSG)
 
-  @mock.patch.object(subprocess, "run", autospec=True)
-  def test_get_all_users_success(self, mock_subprocess_run):
-    mock_subprocess_run.return_value = self.mock_users()
+  def test_start_simpleperf_trace_success(self):
+    # The return value of the patched subprocess.Popen is expected to be
+    # returned unmodified by AndroidDevice.start_simpleperf_trace
+    device = AndroidDevice(TEST_SHELL)
+    mock_process = device.start_simpleperf_trace(TEST_SIMPLEPERF_COMMAND)
 
-    users = AndroidDevice(AdbShell(TEST_DEVICE_SERIAL)).get_all_users()
+    # No exception is expected to be thrown
+    self.assertIs(mock_process, self.mock_popen.return_value)
 
-    self.assertEqual(users, [TEST_USER_ID_1, TEST_USER_ID_2])
+  def test_pull_file_success(self):
+    self.mock_run.return_value = self.empty_output
+    device = AndroidDevice(TEST_SHELL)
 
-  @mock.patch.object(subprocess, "run", autospec=True)
-  def test_get_all_users_failure(self, mock_subprocess_run):
-    mock_subprocess_run.side_effect = TEST_EXCEPTION
-    device = AndroidDevice(AdbShell(TEST_DEVICE_SERIAL))
+    # No exception is expected to be thrown
+    self.assertTrue(device.pull_file(TEST_FILE_PATH, TEST_FILE_PATH))
 
-    with self.assertRaises(Exception) as e:
-      device.get_all_users()
+  def test_get_all_users_success(self):
+    self.mock_run.return_value = self.users_output
 
-    self.assertEqual(str(e.exception), TEST_FAILURE_MSG)
+    users = AndroidDevice(TEST_SHELL).get_all_users()
+
+    self.assertEqual(users, [TEST_USER_ID_1, TEST_USER_ID_2])
 
-  @mock.patch.object(subprocess, "run", autospec=True)
-  def test_user_exists_success(self, mock_subprocess_run):
-    mock_subprocess_run.return_value = self.mock_users()
-    device = AndroidDevice(AdbShell(TEST_DEVICE_SERIAL))
+  def test_user_exists_success(self):
+    self.mock_run.return_value = self.users_output
+    device = AndroidDevice(TEST_SHELL)
 
     error = device.user_exists(TEST_USER_ID_1)
 
-    self.assertEqual(error, None)
+    self.assertIsNone(error)
 
-  @mock.patch.object(subprocess, "run", autospec=True)
-  def test_user_exists_and_user_does_not_exist_failure(self,
-                                                       mock_subprocess_run):
-    mock_subprocess_run.return_value = self.mock_users()
-    device = AndroidDevice(AdbShell(TEST_DEVICE_SERIAL))
+  def test_user_exists_and_user_does_not_exist_failure(self):
+    self.mock_run.return_value = self.users_output
+    device = AndroidDevice(TEST_SHELL)
 
     error = device.user_exists(TEST_USER_ID_3)
 
-    self.assertNotEqual(error, None)
-    self.assertEqual(error.message,
-                     ("User ID %s does not exist on device with"
-                      " serial %s." % (TEST_USER_ID_3, TEST_DEVICE_SERIAL)))
-    self.assertEqual(error.suggestion,
-                     ("Select from one of the following user IDs on device with"
-                      " serial %s: %s, %s" %
-                      (TEST_DEVICE_SERIAL, TEST_USER_ID_1, TEST_USER_ID_2)))
+    self.assertIsNotNone(error)
+    self.assertEqual(error.message, TEST_USER_NOT_EXIST_MSG)
+    self.assertEqual(error.suggestion, TEST_USER_NOT_EXIST_SUGGESTION)
 
-  @mock.patch.object(subprocess, "run", autospec=True)
-  def test_user_exists_and_get_all_users_fails_error(self, mock_subprocess_run):
-    mock_subprocess_run.side_effect = TEST_EXCEPTION
-    device = AndroidDevice(AdbShell(TEST_DEVICE_SERIAL))
+  def test_get_user_info_success(self):
+    self.mock_run.return_value = generate_mock_completed_process(
+        stdout_string=self.users_output.stdout + USER_INFO_SEPARATOR +
+        b'%d\n' % TEST_USER_ID_2)
+    device = AndroidDevice(TEST_SHELL)
 
-    with self.assertRaises(Exception) as e:
-      device.user_exists(TEST_USER_ID_1)
+    users, current_user = device.get_user_info()
 
-    self.assertEqual(str(e.exception), TEST_FAILURE_MSG)
+    self.assertEqual(users, [TEST_USER_ID_1, TEST_USER_ID_2])
+    self.assertEqual(current_user, TEST_USER_ID_2)
+    self.assertEqual(self.mock_run.call_count, 1)
 
-  @mock.patch.object(subprocess, "run", autospec=True)
-  def test_get_current_user_success(self, mock_subprocess_run):
-    mock_subprocess_run.return_value = generate_mock_completed_process(
+  def test_get_current_user_success(self):
+    self.mock_run.return_value = generate_mock_completed_process(
         stdout_string=b'%d\n' % TEST_USER_ID_1)
-    device = AndroidDevice(AdbShell(TEST_DEVICE_SERIAL))
+    device = AndroidDevice(TEST_SHELL)
 
     user = device.get_current_user()
 
     self.assertEqual(user, TEST_USER_ID_1)
 
-  @mock.patch.object(subprocess, "run", autospec=True)
-  def test_get_current_user_failure(self, mock_subprocess_run):
-    mock_subprocess_run.side_effect = TEST_EXCEPTION
-    device = AndroidDevice(AdbShell(TEST_DEVICE_SERIAL))
-
-    with self.assertRaises(Exception) as e:
-      device.get_current_user()
-
-    self.assertEqual(str(e.exception), TEST_FAILURE_MSG)
-
-  @mock.patch.object(subprocess, "run", autospec=True)
-  def test_perform_user_switch_success(self, mock_subprocess_run):
-    mock_subprocess_run.return_value = generate_mock_completed_process()
-    device = AndroidDevice(AdbShell(TEST_DEVICE_SERIAL))
+  def test_perform_user_switch_success(self):
+    self.mock_run.return_value = self.empty_output
+    device = AndroidDevice(TEST_SHELL)
 
     # No exception is expected to be thrown
     device.perform_user_switch(TEST_USER_ID_1)
 
-  @mock.patch.object(subprocess, "run", autospec=True)
-  def test_perform_user_switch_failure(self, mock_subprocess_run):
-    mock_subprocess_run.side_effect = TEST_EXCEPTION
-    device = AndroidDevice(AdbShell(TEST_DEVICE_SERIAL))
-
-    with self.assertRaises(Exception) as e:
-      device.perform_user_switch(TEST_USER_ID_1)
-
-    self.assertEqual(str(e.exception), TEST_FAILURE_MSG)
-
-  @mock.patch.object(subprocess, "run", autospec=True)
-  def test_write_to_file_success(self, mock_subprocess_run):
-    mock_subprocess_run.return_value = generate_mock_completed_process()
-    device = AndroidDevice(AdbShell(TEST_DEVICE_SERIAL))
+  def test_write_to_file_success(self):
+    self.mock_run.return_value = self.empty_output
+    device = AndroidDevice(TEST_SHELL)
 
     # No exception is expected to be thrown
     device.write_to_file(TEST_FILE_PATH, TEST_STRING_FILE)
 
-  @mock.patch.object(subprocess, "run", autospec=True)
-  def test_write_to_file_failure(self, mock_subprocess_run):
-    mock_subprocess_run.side_effect = TEST_EXCEPTION
-    device = AndroidDevice(AdbShell(TEST_DEVICE_SERIAL))
-
-    with self.assertRaises(Exception) as e:
-      device.write_to_file(TEST_FILE_PATH, TEST_STRING_FILE)
-
-    self.assertEqual(str(e.exception), TEST_FAILURE_MSG)
-
-  @mock.patch.object(subprocess, "run", autospec=True)
-  def test_set_prop_success(self, mock_subprocess_run):
-    mock_subprocess_run.return_value = generate_mock_completed_process()
-    device = AndroidDevice(AdbShell(TEST_DEVICE_SERIAL))
+  def test_set_prop_success(self):
+    self.mock_run.return_value = self.empty_output
+    device = AndroidDevice(TEST_SHELL)
 
     # No exception is expected to be thrown
     device.set_prop(TEST_PROP, TEST_PROP_VALUE)
 
-  @mock.patch.object(subprocess, "run", autospec=True)
-  def test_set_prop_failure(self, mock_subprocess_run):
-    mock_subprocess_run.side_effect = TEST_EXCEPTION
-    device = AndroidDevice(AdbShell(TEST_DEVICE_SERIAL))
+  def test_set_props_runs_single_command(self):
+    self.mock_run.return_value = self.empty_output
+    device = AndroidDevice(TEST_SHELL)
 
-    with self.assertRaises(Exception) as e:
-      device.set_prop(TEST_PROP, TEST_PROP_VALUE)
+    device.set_props([(TEST_PROP, TEST_PROP_VALUE), (TEST_PROP, "")])
 
-    self.assertEqual(str(e.exception), TEST_FAILURE_MSG)
+    self.mock_run.assert_called_once()
+    self.assertEqual(self.mock_run.call_args.args[0], [
+        "adb", "-s", TEST_DEVICE_SERIAL, "shell", "sh", "-c",
+        shlex.quote("setprop %s %s && setprop %s ''" %
+                    (TEST_PROP, TEST_PROP_VALUE, TEST_PROP))
+    ])
 
-  @mock.patch("src.shell.poll_is_task_completed", autospec=True)
-  @mock.patch.object(subprocess, "run", autospec=True)
-  def test_reboot_success(self, mock_subprocess_run,
-                          mock_poll_is_task_completed):
-    mock_subprocess_run.return_value = generate_mock_completed_process()
-    device = AndroidDevice(AdbShell(TEST_DEVICE_SERIAL))
-    mock_poll_is_task_completed.return_value = True
+  def test_reboot_success(self):
+    self.mock_run.side_effect = [
+        self.empty_output, self.empty_output, self.disconnected_output,
+        self.empty_output
+    ]
+    device = AndroidDevice(TEST_SHELL)
 
     # No exception is expected to be thrown
     device.reboot()
 
-  @mock.patch.object(subprocess, "run", autospec=True)
-  def test_reboot_failure(self, mock_subprocess_run):
-    mock_subprocess_run.side_effect = TEST_EXCEPTION
-    device = AndroidDevice(AdbShell(TEST_DEVICE_SERIAL))
+    # The device is still listed by the first get-state.
+    self.assertEqual([call.args[0] for call in self.mock_run.call_args_list],
+                     [["adb", "-s", TEST_DEVICE_SERIAL, "reboot"],
+                      ["adb", "-s", TEST_DEVICE_SERIAL, "get-state"],
+                      ["adb", "-s", TEST_DEVICE_SERIAL, "get-state"],
+                      ["adb", "-s", TEST_DEVICE_SERIAL, "wait-for-device"]])
+    self.assertEqual(self.mock_run.call_args.kwargs["timeout"],
+                     BOOT_COMPLETED_TIME_OUT_SECS)
+
+  @mock.patch.object(device_module, "WAIT_FOR_DISCONNECT_TIME_OUT_SECS", 0)
+  def test_reboot_never_disconnects_error(self):
+    self.mock_run.return_value = self.empty_output
+    device = AndroidDevice(TEST_SHELL)
 
     with self.assertRaises(Exception) as e:
       device.reboot()
 
-    self.assertEqual(str(e.exception), TEST_FAILURE_MSG)
+    self.assertEqual(str(e.exception), TEST_REBOOT_START_TIMEOUT_MSG)
+    self.assertEqual(self.mock_run.call_args.args[0],
+                     ["adb", "-s", TEST_DEVICE_SERIAL, "get-state"])
 
-  @mock.patch.object(subprocess, "run", autospec=True)
-  def test_wait_for_device_success(self, mock_subprocess_run):
-    mock_subprocess_run.return_value = generate_mock_completed_process()
-    device = AndroidDevice(AdbShell(TEST_DEVICE_SERIAL))
+  def test_reboot_times_out_error(self):
+    self.mock_run.side_effect = [
+        self.empty_output, self.disconnected_output,
+        subprocess.TimeoutExpired("adb", BOOT_COMPLETED_TIME_OUT_SECS)
+    ]
+    device = AndroidDevice(TEST_SHELL)
 
-    # No exception is expected to be thrown
-    device.wait_for_device()
+    with self.assertRaises(Exception) as e:
+      device.reboot()
 
-  @mock.patch.object(subprocess, "run", autospec=True)
-  def test_wait_for_device_failure(self, mock_subprocess_run):
-    mock_subprocess_run.side_effect = TEST_EXCEPTION
-    device = AndroidDevice(AdbShell(TEST_DEVICE_SERIAL))
+    self.assertEqual(str(e.exception), TEST_REBOOT_RECONNECT_TIMEOUT_MSG)
 
-    with self.assertRaises(Exception) as e:
-      device.wait_for_device()
+  def test_wait_for_device_success(self):
+    self.mock_run.return_value = self.empty_output
+    device = AndroidDevice(TEST_SHELL)
 
-    self.assertEqual(str(e.exception), TEST_FAILURE_MSG)
+    # No exception is expected to be thrown
+    device.wait_for_device()
 
-  @mock.patch.object(subprocess, "run", autospec=True)
-  def test_is_boot_completed_and_is_completed(self, mock_subprocess_run):
-    mock_subprocess_run.return_value = (
+  def test_is_boot_completed_and_is_completed(self):
+    self.mock_run.return_value = (
         generate_mock_completed_process(BOOT_COMPLETE_OUTPUT))
-    device = AndroidDevice(AdbShell(TEST_DEVICE_SERIAL))
+    device = AndroidDevice(TEST_SHELL)
 
     is_completed = device.is_boot_completed()
 
     self.assertEqual(is_completed, True)
 
-  @mock.patch.object(subprocess, "run", autospec=True)
-  def test_is_boot_completed_and_is_not_completed(self, mock_subprocess_run):
-    mock_subprocess_run.return_value = generate_mock_completed_process()
-    device = AndroidDevice(AdbShell(TEST_DEVICE_SERIAL))
+  def test_is_boot_completed_and_is_not_completed(self):
+    self.mock_run.return_value = self.empty_output
+    device = AndroidDevice(TEST_SHELL)
 
     is_completed = device.is_boot_completed()
 
     self.assertFalse(is_completed)
 
-  @mock.patch.object(subprocess, "run", autospec=True)
-  def test_is_boot_completed_failure(self, mock_subprocess_run):
-    mock_subprocess_run.side_effect = TEST_EXCEPTION
-    device = AndroidDevice(AdbShell(TEST_DEVICE_SERIAL))
-
-    with self.assertRaises(Exception) as e:
-      device.is_boot_completed()
-
-    self.assertEqual(str(e.exception), TEST_FAILURE_MSG)
-
-  @mock.patch("src.device.poll_is_task_completed", autospec=True)
-  @mock.patch.object(subprocess, "run", autospec=True)
-  def test_wait_for_boot_to_complete_success(self, mock_subprocess_run,
-                                             mock_poll_is_task_completed):
-    mock_subprocess_run.return_value = (
-        generate_mock_completed_process(BOOT_COMPLETE_OUTPUT))
-    device = AndroidDevice(AdbShell(TEST_DEVICE_SERIAL))
-    mock_poll_is_task_completed.return_value = True
+  def test_wait_for_boot_to_complete_success(self):
+    self.mock_run.return_value = self.empty_output
+    device = AndroidDevice(TEST_SHELL)
 
     # No exception is expected to be thrown
     device.wait_for_boot_to_complete()
 
-  @mock.patch.object(subprocess, "run", autospec=True)
-  def test_wait_for_boot_to_complete_and_is_boot_completed_fails_error(
-      self, mock_subprocess_run):
-    mock_subprocess_run.side_effect = TEST_EXCEPTION
-    device = AndroidDevice(AdbShell(TEST_DEVICE_SERIAL))
+    self.assertEqual(self.mock_run.call_count, 1)
+
+  def test_wait_for_boot_to_complete_times_out_error(self):
+    self.mock_run.return_value = generate_mock_completed_process(
+        returncode=ShellExitCodes.EX_FAILURE.value)
+    device = AndroidDevice(TEST_SHELL)
 
     with self.assertRaises(Exception) as e:
       device.wait_for_boot_to_complete()
 
-    self.assertEqual(str(e.exception), TEST_FAILURE_MSG)
+    self.assertEqual(str(e.exception), TEST_REBOOT_FINISH_TIMEOUT_MSG)
 
-  @mock.patch("src.device.poll_is_task_completed", autospec=True)
-  @mock.patch.object(subprocess, "run", autospec=True)
-  def test_wait_for_boot_to_complete_times_out_error(
-      self, mock_subprocess_run, mock_poll_is_task_completed):
-    mock_subprocess_run.return_value = generate_mock_completed_process()
-    device = AndroidDevice(AdbShell(TEST_DEVICE_SERIAL))
-    mock_poll_is_task_completed.return_value = False
+  def test_wait_for_boot_to_complete_adb_times_out_error(self):
+    self.mock_run.side_effect = subprocess.TimeoutExpired("adb", 35)
+    device = AndroidDevice(TEST_SHELL)
 
     with self.assertRaises(Exception) as e:
       device.wait_for_boot_to_complete()
 
-    self.assertEqual(
-        str(e.exception), ("Device with serial %s took too long to"
-                           " finish rebooting." % TEST_DEVICE_SERIAL))
+    self.assertEqual(str(e.exception), TEST_REBOOT_FINISH_TIMEOUT_MSG)
 
-  @mock.patch.object(subprocess, "run", autospec=True)
-  def test_get_packages_success(self, mock_subprocess_run):
-    mock_subprocess_run.return_value = self.mock_packages()
-    device = AndroidDevice(AdbShell(TEST_DEVICE_SERIAL))
+  def test_get_packages_success(self):
+    self.mock_run.return_value = self.packages_output
+    device = AndroidDevice(TEST_SHELL)
 
     packages = device.get_packages()
 
     self.assertEqual(packages, [TEST_PACKAGE_1, TEST_PACKAGE_2])
 
-  @mock.patch.object(subprocess, "run", autospec=True)
-  def test_get_packages_failure(self, mock_subprocess_run):
-    mock_subprocess_run.side_effect = TEST_EXCEPTION
-    device = AndroidDevice(AdbShell(TEST_DEVICE_SERIAL))
-
-    with self.assertRaises(Exception) as e:
-      device.get_packages()
-
-    self.assertEqual(str(e.exception), TEST_FAILURE_MSG)
-
-  @mock.patch.object(subprocess, "run", autospec=True)
-  def test_get_pid_success(self, mock_subprocess_run):
-    mock_subprocess_run.return_value = generate_mock_completed_process(
+  def test_get_pid_success(self):
+    self.mock_run.return_value = generate_mock_completed_process(
         TEST_PID_OUTPUT)
-    device = AndroidDevice(AdbShell(TEST_DEVICE_SERIAL))
+    device = AndroidDevice(TEST_SHELL)
 
     process_id = device.get_pid(TEST_PACKAGE_1)
 
     self.assertEqual(process_id, "8241")
 
-  @mock.patch.object(subprocess, "run", autospec=True)
-  def test_get_pid_failure(self, mock_subprocess_run):
-    mock_subprocess_run.side_effect = TEST_EXCEPTION
-    device = AndroidDevice(AdbShell(TEST_DEVICE_SERIAL))
-
-    with self.assertRaises(Exception) as e:
-      device.get_pid(TEST_PACKAGE_1)
-
-    self.assertEqual(str(e.exception), TEST_FAILURE_MSG)
-
-  @mock.patch.object(subprocess, "run", autospec=True)
-  def test_package_running(self, mock_subprocess_run):
-    mock_subprocess_run.return_value = generate_mock_completed_process(
+  def test_package_running(self):
+    self.mock_run.return_value = generate_mock_completed_process(
         TEST_PID_OUTPUT)
-    device = AndroidDevice(AdbShell(TEST_DEVICE_SERIAL))
+    device = AndroidDevice(TEST_SHELL)
 
     is_running = device.is_process_running(TEST_PACKAGE_1)
 
     self.assertEqual(is_running, True)
 
-  @mock.patch.object(subprocess, "run", autospec=True)
-  def test_package_not_running(self, mock_subprocess_run):
-    mock_subprocess_run.return_value = generate_mock_completed_process()
-    device = AndroidDevice(AdbShell(TEST_DEVICE_SERIAL))
+  def test_package_not_running(self):
+    self.mock_run.return_value = generate_mock_completed_process(
+        returncode=ShellExitCodes.EX_FAILURE.value)
+    device = AndroidDevice(TEST_SHELL)
 
     is_running = device.is_process_running(TEST_PACKAGE_1)
 
     self.assertFalse(is_running)
 
-  @mock.patch.object(subprocess, "run", autospec=True)
-  def test_package_running_and_get_pid_failure(self, mock_subprocess_run):
-    mock_subprocess_run.side_effect = TEST_EXCEPTION
-    device = AndroidDevice(AdbShell(TEST_DEVICE_SERIAL))
-
-    with self.assertRaises(Exception) as e:
-      device.is_process_running(TEST_PACKAGE_1)
-
-    self.assertEqual(str(e.exception), TEST_FAILURE_MSG)
-
-  @mock.patch.object(subprocess, "run", autospec=True)
-  def test_start_package_success(self, mock_subprocess_run):
-    mock_subprocess_run.return_value = generate_mock_completed_process()
-    device = AndroidDevice(AdbShell(TEST_DEVICE_SERIAL))
+  def test_start_package_success(self):
+    self.mock_run.return_value = self.empty_output
+    device = AndroidDevice(TEST_SHELL)
 
     error = device.start_package(TEST_PACKAGE_1)
 
-    self.assertEqual(error, None)
+    self.assertIsNone(error)
 
-  @mock.patch.object(subprocess, "run", autospec=True)
-  def test_start_package_fails_with_service_app(self, mock_subprocess_run):
-    mock_subprocess_run.return_value = generate_mock_completed_process(
+  def test_start_package_fails_with_service_app(self):
+    self.mock_run.return_value = generate_mock_completed_process(
         stderr_string=b'%s\n' % TEST_FAILURE_MSG.encode("utf-8"))
-    device = AndroidDevice(AdbShell(TEST_DEVICE_SERIAL))
+    device = AndroidDevice(TEST_SHELL)
 
     error = device.start_package(TEST_PACKAGE_1)
 
-    self.assertNotEqual(error, None)
-    self.assertEqual(error.message,
-                     ("Cannot start package %s on device with"
-                      " serial %s because %s is a service"
-                      " package, which doesn't implement a MAIN"
-                      " activity." %
-                      (TEST_PACKAGE_1, TEST_DEVICE_SERIAL, TEST_PACKAGE_1)))
-    self.assertEqual(error.suggestion, None)
+    self.assertIsNotNone(error)
+    self.assertEqual(error.message, TEST_SERVICE_PACKAGE_MSG)
+    self.assertIsNone(error.suggestion)
 
-  @mock.patch.object(subprocess, "run", autospec=True)
-  def test_start_package_failure(self, mock_subprocess_run):
-    mock_subprocess_run.side_effect = TEST_EXCEPTION
-    device = AndroidDevice(AdbShell(TEST_DEVICE_SERIAL))
-
-    with self.assertRaises(Exception) as e:
-      device.start_package(TEST_PACKAGE_1)
-
-    self.assertEqual(str(e.exception), TEST_FAILURE_MSG)
-
-  @mock.patch.object(subprocess, "run", autospec=True)
-  def test_kill_process_success(self, mock_subprocess_run):
-    mock_subprocess_run.return_value = generate_mock_completed_process(
+  def test_kill_process_success(self):
+    self.mock_run.return_value = generate_mock_completed_process(
         TEST_PID_OUTPUT)
-    device = AndroidDevice(AdbShell(TEST_DEVICE_SERIAL))
+    device = AndroidDevice(TEST_SHELL)
 
     # No exception is expected to be thrown
     device.kill_process(TEST_PACKAGE_1)
 
-  @mock.patch.object(subprocess, "run", autospec=True)
-  def test_kill_process_and_get_pid_failure(self, mock_subprocess_run):
-    mock_subprocess_run.side_effect = TEST_EXCEPTION
-    device = AndroidDevice(AdbShell(TEST_DEVICE_SERIAL))
+  def test_kill_process_failure(self):
+    self.mock_run.return_value = generate_mock_completed_process(
+        returncode=ShellExitCodes.EX_FAILURE.value)
+    device = AndroidDevice(TEST_SHELL)
 
-    with self.assertRaises(Exception) as e:
+    with self.assertRaises(Exception):
       device.kill_process(TEST_PACKAGE_1)
 
-    self.assertEqual(str(e.exception), TEST_FAILURE_MSG)
+  def test_kill_process_uses_single_adb_call(self):
+    self.mock_run.return_value = self.empty_output
+    device = AndroidDevice(TEST_SHELL)
 
-  @mock.patch.object(subprocess, "run", autospec=True)
-  def test_kill_process_failure(self, mock_subprocess_run):
-    mock_subprocess_run.side_effect = [
-        generate_mock_completed_process(TEST_PID_OUTPUT), TEST_EXCEPTION
-    ]
-    device = AndroidDevice(AdbShell(TEST_DEVICE_SERIAL))
-
-    with self.assertRaises(Exception) as e:
-      device.kill_process(TEST_PACKAGE_1)
+    device.kill_process(TEST_PACKAGE_1)
 
-    self.assertEqual(str(e.exception), TEST_FAILURE_MSG)
+    self.assertEqual(self.mock_run.call_count, 1)
+    self.assertEqual(self.mock_run.call_args.args[0][-1], TEST_PACKAGE_1)
 
-  @mock.patch.object(subprocess, "run", autospec=True)
-  def test_force_stop_package_success(self, mock_subprocess_run):
-    mock_subprocess_run.return_value = generate_mock_completed_process()
-    device = AndroidDevice(AdbShell(TEST_DEVICE_SERIAL))
+  def test_shell_exec_quotes_args(self):
+    self.mock_run.return_value = self.empty_output
+    device = AndroidDevice(TEST_SHELL)
 
-    # No exception is expected to be thrown
-    device.force_stop_package(TEST_PACKAGE_1)
+    device.set_prop(TEST_PROP, "a value; with \"quotes")
 
-  @mock.patch.object(subprocess, "run", autospec=True)
-  def test_force_stop_package_failure(self, mock_subprocess_run):
-    mock_subprocess_run.side_effect = TEST_EXCEPTION
-    device = AndroidDevice(AdbShell(TEST_DEVICE_SERIAL))
+    self.assertEqual(self.mock_run.call_args.args[0], [
+        "adb", "-s", TEST_DEVICE_SERIAL, "shell", "setprop", TEST_PROP,
+        "'a value; with \"quotes'"
+    ])
 
-    with self.assertRaises(Exception) as e:
-      device.force_stop_package(TEST_PACKAGE_1)
+  def test_force_stop_package_success(self):
+    self.mock_run.return_value = self.empty_output
+    device = AndroidDevice(TEST_SHELL)
 
-    self.assertEqual(str(e.exception), TEST_FAILURE_MSG)
+    # No exception is expected to be thrown
+    device.force_stop_package(TEST_PACKAGE_1)
 
-  @mock.patch.object(subprocess, "run", autospec=True)
-  def test_get_prop_success(self, mock_subprocess_run):
+  def test_get_prop_success(self):
     test_prop_value = ANDROID_SDK_VERSION_T
-    mock_subprocess_run.return_value = generate_mock_completed_process(
+    self.mock_run.return_value = generate_mock_completed_process(
         stdout_string=b'%d\n' % test_prop_value)
-    device = AndroidDevice(AdbShell(TEST_DEVICE_SERIAL))
+    device = AndroidDevice(TEST_SHELL)
 
     prop_value = int(device.get_prop(TEST_PROP))
 
     self.assertEqual(prop_value, test_prop_value)
 
-  @mock.patch.object(subprocess, "run", autospec=True)
-  def test_get_prop_package_failure(self, mock_subprocess_run):
-    mock_subprocess_run.side_effect = TEST_EXCEPTION
-    device = AndroidDevice(AdbShell(TEST_DEVICE_SERIAL))
-
-    with self.assertRaises(Exception) as e:
-      device.get_prop(TEST_PROP)
-
-    self.assertEqual(str(e.exception), TEST_FAILURE_MSG)
-
-  @mock.patch.object(subprocess, "run", autospec=True)
-  def test_get_android_sdk_version_success(self, mock_subprocess_run):
-    mock_subprocess_run.return_value = generate_mock_completed_process(
+  def test_get_android_sdk_version_success(self):
+    self.mock_run.return_value = generate_mock_completed_process(
         stdout_string=b'%d\n' % ANDROID_SDK_VERSION_T)
-    device = AndroidDevice(AdbShell(TEST_DEVICE_SERIAL))
+    device = AndroidDevice(TEST_SHELL)
 
     prop_value = device.get_android_sdk_version()
 
     self.assertEqual(prop_value, ANDROID_SDK_VERSION_T)
 
-  @mock.patch.object(subprocess, "run", autospec=True)
-  def test_get_android_sdk_version_failure(self, mock_subprocess_run):
-    mock_subprocess_run.side_effect = TEST_EXCEPTION
-    device = AndroidDevice(AdbShell(TEST_DEVICE_SERIAL))
+  def test_get_android_sdk_version_is_cached_until_reboot(self):
+    sdk_version_output = generate_mock_completed_process(stdout_string=b'%d\n' %
+                                                         ANDROID_SDK_VERSION_T)
+    self.mock_run.side_effect = [
+        sdk_version_output, self.empty_output, self.disconnected_output,
+        self.empty_output, sdk_version_output
+    ]
+    device = AndroidDevice(TEST_SHELL)
 
-    with self.assertRaises(Exception) as e:
-      device.get_android_sdk_version()
+    device.get_android_sdk_version()
+    device.get_android_sdk_version()
+    self.assertEqual(self.mock_run.call_count, 1)
+    device.reboot()
+    prop_value = device.get_android_sdk_version()
 
-    self.assertEqual(str(e.exception), TEST_FAILURE_MSG)
+    # getprop, reboot, get-state, wait-for-device, getprop
+    self.assertEqual(self.mock_run.call_count, 5)
+    self.assertEqual(prop_value, ANDROID_SDK_VERSION_T)
 
-  @mock.patch.object(subprocess, "run", autospec=True)
-  def test_simpleperf_event_exists_success(self, mock_subprocess_run):
-    mock_subprocess_run.return_value = (
-        generate_mock_completed_process(b'List of software events:\n  '
-                                        b'alignment-faults\n  '
-                                        b'context-switches\n  '
-                                        b'cpu-clock\n  '
-                                        b'cpu-migrations\n  '
-                                        b'emulation-faults\n  '
-                                        b'major-faults\n  '
-                                        b'minor-faults\n  page-faults\n  '
-                                        b'task-clock'))
-    device = AndroidDevice(AdbShell(TEST_DEVICE_SERIAL))
+  def test_simpleperf_event_exists_success(self):
+    self.mock_run.return_value = self.simpleperf_list_output
+    device = AndroidDevice(TEST_SHELL)
 
     events = ["cpu-clock", "minor-faults"]
     # No exception is expected to be thrown
     error = device.simpleperf_event_exists(events)
 
-    self.assertEqual(error, None)
+    self.assertIsNone(error)
     # Check that the list passed to the function is unchanged
     self.assertEqual(events, ["cpu-clock", "minor-faults"])
 
-  @mock.patch.object(subprocess, "run", autospec=True)
-  def test_simpleperf_event_exists_failure(self, mock_subprocess_run):
-    mock_subprocess_run.return_value = (
-        generate_mock_completed_process(b'List of software events:\n  '
-                                        b'alignment-faults\n  '
-                                        b'context-switches\n  '
-                                        b'cpu-clock\n  '
-                                        b'cpu-migrations\n  '
-                                        b'emulation-faults\n  '
-                                        b'major-faults\n  '
-                                        b'minor-faults\n  page-faults\n  '
-                                        b'task-clock'))
-    device = AndroidDevice(AdbShell(TEST_DEVICE_SERIAL))
+  def test_simpleperf_event_exists_failure(self):
+    self.mock_run.return_value = self.simpleperf_list_output
+    device = AndroidDevice(TEST_SHELL)
 
     error = device.simpleperf_event_exists(
         ["cpu-clock", "minor-faults", "List"])
@@ -861,12 +744,25 @@ class DeviceUnitTest(unittest.TestCase):
         error.suggestion, "Run adb shell simpleperf list to"
         " see valid simpleperf events.")
 
-  @mock.patch.object(subprocess, "run", autospec=True)
-  def test_simpleperf_not_installed(self, mock_subprocess_run):
-    mock_subprocess_run.return_value = (
+  def test_simpleperf_event_exists_lists_events_once(self):
+    self.mock_run.return_value = (
+        generate_mock_completed_process(b'List of software events:\n  '
+                                        b'cpu-clock\n  '
+                                        b'minor-faults\n'))
+    device = AndroidDevice(TEST_SHELL)
+
+    device.simpleperf_event_exists(["cpu-clock"])
+    error = device.simpleperf_event_exists(["minor-faults"])
+
+    self.assertIsNone(error)
+    # One call to check simpleperf exists and one to list its events
+    self.assertEqual(self.mock_run.call_count, 2)
+
+  def test_simpleperf_not_installed(self):
+    self.mock_run.return_value = (
         generate_mock_completed_process(
             returncode=ShellExitCodes.EX_FAILURE.value))
-    device = AndroidDevice(AdbShell(TEST_DEVICE_SERIAL))
+    device = AndroidDevice(TEST_SHELL)
 
     error = device.simpleperf_event_exists(
         ["cpu-clock", "minor-faults", "List"])
@@ -875,29 +771,269 @@ class DeviceUnitTest(unittest.TestCase):
     self.assertEqual(error.suggestion,
                      "Push the simpleperf binary to the device.")
 
-  @mock.patch.object(subprocess, "run", autospec=True)
-  def test_file_exists_success(self, mock_subprocess_run):
-    mock_subprocess_run.return_value = generate_mock_completed_process()
-    device = AndroidDevice(AdbShell(TEST_DEVICE_SERIAL))
+  def test_file_exists_success(self):
+    self.mock_run.return_value = self.empty_output
+    device = AndroidDevice(TEST_SHELL)
 
     self.assertTrue(device.file_exists("perfetto"))
 
-  @mock.patch.object(subprocess, "run", autospec=True)
-  def test_file_exists_failure(self, mock_subprocess_run):
-    mock_subprocess_run.return_value = (
+  def test_file_exists_failure(self):
+    self.mock_run.return_value = (
         generate_mock_completed_process(
             returncode=ShellExitCodes.EX_FAILURE.value))
-    device = AndroidDevice(AdbShell(TEST_DEVICE_SERIAL))
+    device = AndroidDevice(TEST_SHELL)
 
     self.assertFalse(device.file_exists("perfetto"))
 
-  @mock.patch.object(subprocess, "run", autospec=True)
-  def test_adb_exists(self, mock_subprocess_run):
-    mock_subprocess_run.return_value = (
-        generate_mock_completed_process(
-            returncode=ShellExitCodes.EX_NOTFOUND.value))
+  def mock_persistent_shell(self, *responses):
+    """
+    Returns a mock 'adb shell' process that answers each command written to
+    it with the next (stdout, stderr) of responses, and exits once there are
+    none left.
+    """
+    stdout_read, stdout_write = os.pipe()
+    stderr_read, stderr_write = os.pipe()
+    stdout = open(stdout_read, "rb")
+    stderr = open(stderr_read, "rb")
+    stdout_writer = open(stdout_write, "wb", buffering=0)
+    stderr_writer = open(stderr_write, "wb", buffering=0)
+    for pipe in (stdout, stderr, stdout_writer, stderr_writer):
+      self.addCleanup(pipe.close)
+    responses = iter(responses)
+
+    def answer(command):
+      response = next(responses, None)
+      if response is None:
+        stdout_writer.close()
+        stderr_writer.close()
+      else:
+        stdout_writer.write(response[0])
+        stderr_writer.write(response[1])
+
+    mock_process = mock.Mock()
+    mock_process.poll.return_value = None
+    mock_process.stdin.write.side_effect = answer
+    mock_process.stdout = stdout
+    mock_process.stderr = stderr
+    return mock_process
+
+  def test_shell_exec_persistent_success(self):
+    self.mock_popen.return_value = self.mock_persistent_shell(
+        (b'%d\n__TORQ_END__ 0\n' % ANDROID_SDK_VERSION_T, b'__TORQ_END__\n'))
+    device = AndroidDevice(AdbShell(TEST_DEVICE_SERIAL, persistent=True))
+
+    prop_value = device.get_prop(TEST_PROP)
+
+    self.assertEqual(prop_value, str(ANDROID_SDK_VERSION_T))
+    self.mock_popen.return_value.stdin.write.assert_called_once_with(
+        b'getprop %s </dev/null; echo __TORQ_END__ $?; echo __TORQ_END__ >&2\n'
+        % TEST_PROP.encode("utf-8"))
+    self.mock_run.assert_not_called()
+
+  def test_shell_exec_persistent_reuses_process(self):
+    self.mock_popen.return_value = self.mock_persistent_shell(
+        (b'__TORQ_END__ 0\n', b'__TORQ_END__\n'),
+        (b'__TORQ_END__ 1\n', b'__TORQ_END__\n'))
+    device = AndroidDevice(AdbShell(TEST_DEVICE_SERIAL, persistent=True))
+
+    self.assertTrue(device.file_exists(TEST_FILE_PATH))
+    self.assertFalse(device.file_exists(TEST_FILE_PATH))
+    self.assertEqual(self.mock_popen.call_count, 1)
+
+  def test_shell_exec_persistent_returncode_failure(self):
+    self.mock_popen.return_value = self.mock_persistent_shell(
+        (b'__TORQ_END__ 1\n',
+         b'%s\n__TORQ_END__\n' % TEST_FAILURE_MSG.encode("utf-8")))
+    device = AndroidDevice(AdbShell(TEST_DEVICE_SERIAL, persistent=True))
+
+    with self.assertRaises(subprocess.CalledProcessError) as e:
+      device.set_prop(TEST_PROP, TEST_PROP_VALUE)
+
+    self.assertEqual(e.exception.stderr,
+                     b'%s\n' % TEST_FAILURE_MSG.encode("utf-8"))
+
+  def test_shell_exec_persistent_shell_exits_error(self):
+    self.mock_popen.return_value = self.mock_persistent_shell()
+    device = AndroidDevice(AdbShell(TEST_DEVICE_SERIAL, persistent=True))
+
+    with self.assertRaises(Exception) as e:
+      device.get_prop(TEST_PROP)
+
+    self.assertEqual(str(e.exception), TEST_SHELL_EXITED_MSG)
+    self.mock_popen.return_value.kill.assert_called_once()
+    # The command may have run, so it is not run again.
+    self.mock_run.assert_not_called()
+
+  def test_shell_exec_persistent_shell_times_out_error(self):
+    # The command is never answered, e.g. because the device disconnected.
+    unanswered_shell = self.mock_persistent_shell((b'', b''))
+    self.mock_popen.side_effect = [
+        unanswered_shell,
+        self.mock_persistent_shell((b'__TORQ_END__ 0\n', b'__TORQ_END__\n'))
+    ]
+    adb_shell = AdbShell(TEST_DEVICE_SERIAL, persistent=True)
+
+    with self.assertRaises(subprocess.TimeoutExpired):
+      adb_shell.shell_exec(["getprop", TEST_PROP], timeout=0)
+
+    unanswered_shell.kill.assert_called_once()
+    self.mock_run.assert_not_called()
+    adb_shell.shell_exec(["getprop", TEST_PROP])
+    self.assertEqual(self.mock_popen.call_count, 2)
+
+  def test_shell_exec_persistent_shell_not_written_runs_command(self):
+    self.mock_popen.return_value.poll.return_value = None
+    self.mock_popen.return_value.stdin.write.side_effect = BrokenPipeError()
+    self.mock_run.return_value = generate_mock_completed_process(
+        stdout_string=b'%d\n' % ANDROID_SDK_VERSION_T)
+    device = AndroidDevice(AdbShell(TEST_DEVICE_SERIAL, persistent=True))
+
+    prop_value = device.get_prop(TEST_PROP)
+
+    self.assertEqual(prop_value, str(ANDROID_SDK_VERSION_T))
+    self.assertEqual(
+        self.mock_run.call_args.args[0],
+        ["adb", "-s", TEST_DEVICE_SERIAL, "shell", "getprop", TEST_PROP])
 
-    self.assertFalse(AdbShell.adb_exists())
+  def test_close_terminates_persistent_shell(self):
+    self.mock_popen.return_value = self.mock_persistent_shell(
+        (b'__TORQ_END__ 0\n', b'__TORQ_END__\n'))
+    device = AndroidDevice(AdbShell(TEST_DEVICE_SERIAL, persistent=True))
+    device.set_prop(TEST_PROP, TEST_PROP_VALUE)
+
+    device.close()
+
+    self.mock_popen.return_value.terminate.assert_called_once()
+
+  def test_get_default_serial_adb_not_found_error(self):
+    self.mock_run.side_effect = FileNotFoundError()
+
+    serial, error = AdbShell.get_default_serial()
+
+    self.assertIsNone(serial)
+    self.assertIsNotNone(error)
+    self.assertEqual(error.message, TEST_ADB_NOT_FOUND_MSG)
+    self.assertEqual(self.mock_run.call_count, 1)
+
+  def test_verify_serial_adb_not_found_error(self):
+    self.mock_run.side_effect = FileNotFoundError()
+
+    error = AdbShell.verify_serial(TEST_DEVICE_SERIAL)
+
+    self.assertIsNotNone(error)
+    self.assertEqual(error.message, TEST_ADB_NOT_FOUND_MSG)
+    self.assertEqual(self.mock_run.call_count, 1)
+
+
+class AdbShellSerialUnitTest(unittest.TestCase):
+
+  def setUp(self):
+    # These tests only depend on the connected devices, so the parsing of
+    # 'adb devices' is tested separately in DeviceUnitTest.
+    patcher = mock.patch.object(AdbShell, "get_adb_devices")
+    self.mock_get_adb_devices = patcher.start()
+    self.addCleanup(patcher.stop)
+
+  def test_verify_serial_arg_in_devices(self):
+    self.mock_get_adb_devices.return_value = [TEST_DEVICE_SERIAL]
+
+    error = AdbShell.verify_serial(TEST_DEVICE_SERIAL)
+
+    self.assertIsNone(error)
+
+  def test_verify_serial_arg_not_in_devices_error(self):
+    self.mock_get_adb_devices.return_value = [TEST_DEVICE_SERIAL]
+
+    error = AdbShell.verify_serial("invalid-device-serial")
+
+    self.assertIsNotNone(error)
+    self.assertEqual(
+        error.message,
+        "Device with serial invalid-device-serial is not connected.")
+    self.assertIsNone(error.suggestion)
+
+  @android_serial(TEST_DEVICE_SERIAL)
+  def test_get_default_serial_env_variable_in_devices(self):
+    self.mock_get_adb_devices.return_value = [TEST_DEVICE_SERIAL]
+
+    serial, error = AdbShell.get_default_serial()
+
+    self.assertIsNone(error)
+    self.assertEqual(serial, TEST_DEVICE_SERIAL)
+
+  @android_serial("invalid-device-serial")
+  def test_get_default_serial_env_variable_not_in_devices_error(self):
+    self.mock_get_adb_devices.return_value = [TEST_DEVICE_SERIAL]
+
+    serial, error = AdbShell.get_default_serial()
+
+    self.assertIsNone(serial)
+    self.assertIsNotNone(error)
+    self.assertEqual(error.message, ("Device with serial invalid-device-serial"
+                                     " is set as environment variable,"
+                                     " ANDROID_SERIAL, but is not connected."))
+    self.assertIsNone(error.suggestion)
+
+  def test_get_default_serial_no_devices_connected_error(self):
+    self.mock_get_adb_devices.return_value = []
+
+    serial, error = AdbShell.get_default_serial()
+
+    self.assertIsNone(serial)
+    self.assertIsNotNone(error)
+    self.assertEqual(error.message, TEST_NO_DEVICES_MSG)
+    self.assertIsNone(error.suggestion)
+
+  @android_serial()
+  def test_get_default_serial_only_one_device(self):
+    self.mock_get_adb_devices.return_value = [TEST_DEVICE_SERIAL]
+
+    serial, error = AdbShell.get_default_serial()
+
+    self.assertIsNone(error)
+    self.assertEqual(serial, TEST_DEVICE_SERIAL)
+
+  @android_serial()
+  @mock.patch.object(builtins, "input", lambda _: "0")
+  def test_get_default_serial_multiple_devices_select_first(self):
+    self.mock_get_adb_devices.return_value = [
+        TEST_DEVICE_SERIAL, TEST_DEVICE_SERIAL2
+    ]
+
+    serial, error = AdbShell.get_default_serial()
+
+    self.assertIsNone(error)
+    self.assertEqual(serial, TEST_DEVICE_SERIAL)
+
+  @android_serial()
+  @mock.patch.object(sys, "argv", ["torq", "-d", "5000"])
+  @mock.patch.object(builtins, "input")
+  def test_get_default_serial_multiple_devices_prompt(self, mock_input):
+    mock_input.return_value = "0"
+    self.mock_get_adb_devices.return_value = [
+        TEST_DEVICE_SERIAL, TEST_DEVICE_SERIAL2
+    ]
+
+    AdbShell.get_default_serial()
+
+    mock_input.assert_called_once_with(
+        "There is more than one device currently connected. Press the"
+        " corresponding number for the following options to choose the device"
+        " you want to use.\n\t0: torq --serial %s -d 5000\n\t1: torq --serial"
+        " %s -d 5000\nSelect device[0-1]: " %
+        (TEST_DEVICE_SERIAL, TEST_DEVICE_SERIAL2))
+
+  @android_serial()
+  @mock.patch.object(builtins, "input", lambda _: "1")
+  def test_get_default_serial_multiple_devices_select_second(self):
+    self.mock_get_adb_devices.return_value = [
+        TEST_DEVICE_SERIAL, TEST_DEVICE_SERIAL2
+    ]
+
+    serial, error = AdbShell.get_default_serial()
+
+    self.assertIsNone(error)
+    self.assertEqual(serial, TEST_DEVICE_SERIAL2)
 
 
 if __name__ == '__main__':
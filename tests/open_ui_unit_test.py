@@ -44,7 +44,7 @@ class OpenUiUnitTest(unittest.TestCase):
       os.environ, {"ANDROID_BUILD_TOP": ANDROID_BUILD_TOP}, clear=True)
   @mock.patch.object(os.path, "exists", autospec=True)
   @mock.patch.object(os.path, "getsize", autospec=True)
-  @mock.patch.object(subprocess, "run", autospec=True)
+  @mock.patch.object(subprocess, "run")
   @mock.patch.object(builtins, "input")
   def test_download_trace_processor_successfully(self, mock_input,
                                                  mock_subprocess_run,
@@ -65,7 +65,7 @@ class OpenUiUnitTest(unittest.TestCase):
       os.environ, {"ANDROID_BUILD_TOP": ANDROID_BUILD_TOP}, clear=True)
   @mock.patch.object(os.path, "exists", autospec=True)
   @mock.patch.object(os.path, "getsize", autospec=True)
-  @mock.patch.object(subprocess, "run", autospec=True)
+  @mock.patch.object(subprocess, "run")
   @mock.patch.object(builtins, "input")
   def test_download_trace_processor_failed(self, mock_input,
                                            mock_subprocess_run, mock_getsize,
@@ -129,10 +129,10 @@ class OpenUiUnitTest(unittest.TestCase):
   @mock.patch.object(os.path, "getsize", autospec=True)
   @mock.patch.object(os.path, "abspath", autospec=True)
   @mock.patch.object(webbrowser, "open_new_tab", autospec=True)
-  @mock.patch.object(subprocess, "run", autospec=True)
+  @mock.patch.object(subprocess, "run")
   @mock.patch.object(os.path, "exists", autospec=True)
   @mock.patch.object(os.path, "expanduser", autospec=True)
-  @mock.patch.object(subprocess, "Popen", autospec=True)
+  @mock.patch.object(subprocess, "Popen")
   def test_open_trace_scripts_large_file(self, mock_popen, mock_expanduser,
                                          mock_exists, mock_subprocess_run,
                                          mock_open_new_tab, mock_abspath,
@@ -164,8 +164,8 @@ class OpenUiUnitTest(unittest.TestCase):
   @mock.patch.object(os.path, "exists", autospec=True)
   @mock.patch.object(os.path, "getsize", autospec=True)
   @mock.patch.object(webbrowser, "open_new_tab", autospec=True)
-  @mock.patch.object(subprocess, "run", autospec=True)
-  @mock.patch.object(subprocess, "Popen", autospec=True)
+  @mock.patch.object(subprocess, "run")
+  @mock.patch.object(subprocess, "Popen")
   def test_open_trace_scripts_large_file_use_trace_processor_enabled(
       self, mock_popen, mock_subprocess_run, mock_open_new_tab, mock_getsize,
       mock_exists):
@@ -218,8 +218,8 @@ class OpenUiUnitTest(unittest.TestCase):
   @mock.patch.object(os.path, "exists", autospec=True)
   @mock.patch.object(os.path, "getsize", autospec=True)
   @mock.patch.object(webbrowser, "open_new_tab", autospec=True)
-  @mock.patch.object(subprocess, "run", autospec=True)
-  @mock.patch.object(subprocess, "Popen", autospec=True)
+  @mock.patch.object(subprocess, "run")
+  @mock.patch.object(subprocess, "Popen")
   def test_download_trace_processor_small_file_use_trace_processor_enabled(
       self, mock_popen, mock_subprocess_run, mock_open_new_tab, mock_getsize,
       mock_exists):
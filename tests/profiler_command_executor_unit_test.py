@@ -18,13 +18,13 @@ import os
 import unittest
 import signal
 import subprocess
-import time
 from unittest import mock
 from src.base import ValidationError
 from src.device import AndroidDevice
 from src.profiler import (DEFAULT_DUR_MS, DEFAULT_OUT_DIR, get_executor,
                           ProfilerCommand)
-from tests.test_utils import generate_mock_completed_process, parameterized_profiler
+from tests.test_utils import (generate_mock_completed_process, NoSleepTestCase,
+                              parameterized_profiler)
 
 PROFILER_COMMAND_TYPE = "profiler"
 TEST_ERROR_MSG = "test-error"
@@ -43,7 +43,20 @@ ANDROID_SDK_VERSION_S = 32
 ANDROID_SDK_VERSION_T = 33
 
 
-class ProfilerCommandExecutorUnitTest(unittest.TestCase):
+class ExecutorUnitTestCase(NoSleepTestCase):
+  """
+  Test case for the executors, which don't wait for the polled device state
+  either.
+  """
+
+  @classmethod
+  def setUpClass(cls):
+    super().setUpClass()
+    cls.start_class_patch(
+        mock.patch('src.profiler.poll_is_task_completed', return_value=True))
+
+
+class ProfilerCommandExecutorUnitTest(ExecutorUnitTestCase):
 
   def setUpSubtest(self, profiler):
     self.command = ProfilerCommand(PROFILER_COMMAND_TYPE, "custom", profiler,
@@ -55,30 +68,20 @@ class ProfilerCommandExecutorUnitTest(unittest.TestCase):
     if profiler == "simpleperf":
       self.command.symbols = "/"
       self.command.scripts_path = "/"
-    self.mock_device = mock.create_autospec(AndroidDevice, instance=True)
+    self.mock_device = mock.MagicMock(spec_set=AndroidDevice)
     self.mock_device.get_android_sdk_version.return_value = (
         ANDROID_SDK_VERSION_T)
     self.mock_device.create_directory.return_value = None
     self.mock_device.id.return_value = TEST_SERIAL
-    self.mock_sleep_patcher = mock.patch.object(
-        time, 'sleep', return_value=None)
-    self.mock_sleep_patcher.start()
-    self.mock_poll_patcher = mock.patch(
-        'src.profiler.poll_is_task_completed', return_value=True)
-    self.mock_poll_patcher.start()
-
-  def tearDown(self):
-    self.mock_sleep_patcher.stop()
-    self.mock_poll_patcher.stop()
 
   @parameterized_profiler(setup_func=setUpSubtest)
-  @mock.patch.object(subprocess, "run", autospec=True)
-  @mock.patch.object(subprocess, "Popen", autospec=True)
+  @mock.patch.object(subprocess, "run")
+  @mock.patch.object(subprocess, "Popen")
   @mock.patch.object(os.path, "exists", autospec=True)
   def test_execute_one_profiler_run_and_use_ui_success(self, profiler,
                                                        mock_exists,
                                                        mock_process, mock_run):
-    with (mock.patch("src.profiler.open_trace", autospec=True) as
+    with (mock.patch("src.open_ui_utils.open_trace", autospec=True) as
           mock_open_trace):
       mock_open_trace.return_value = None
       self.command.use_ui = True
@@ -95,8 +98,8 @@ class ProfilerCommandExecutorUnitTest(unittest.TestCase):
       self.assertEqual(self.mock_device.pull_file.call_count, 1)
 
   @parameterized_profiler(setup_func=setUpSubtest)
-  @mock.patch.object(subprocess, "run", autospec=True)
-  @mock.patch.object(subprocess, "Popen", autospec=True)
+  @mock.patch.object(subprocess, "run")
+  @mock.patch.object(subprocess, "Popen")
   @mock.patch.object(os.path, "exists", autospec=True)
   def test_execute_one_profiler_run_no_dur_ms_success(self, profiler,
                                                       mock_exists, mock_process,
@@ -107,7 +110,7 @@ class ProfilerCommandExecutorUnitTest(unittest.TestCase):
       os.kill(os.getpid(), signal.SIGINT)
       return None
 
-    with (mock.patch("src.profiler.open_trace", autospec=True) as
+    with (mock.patch("src.open_ui_utils.open_trace", autospec=True) as
           mock_open_trace):
       self.command.dur_ms = None
       mock_open_trace.return_value = None
@@ -124,13 +127,13 @@ class ProfilerCommandExecutorUnitTest(unittest.TestCase):
       self.assertEqual(error, None)
       self.assertEqual(self.mock_device.pull_file.call_count, 1)
 
-  @mock.patch.object(subprocess, "run", autospec=True)
-  @mock.patch.object(subprocess, "Popen", autospec=True)
+  @mock.patch.object(subprocess, "run")
+  @mock.patch.object(subprocess, "Popen")
   @mock.patch.object(os.path, "exists", autospec=True)
   def test_execute_one_simpleperf_run_failure(self, mock_exists, mock_process,
                                               mock_run):
     self.setUpSubtest("simpleperf")
-    with (mock.patch("src.profiler.open_trace", autospec=True) as
+    with (mock.patch("src.open_ui_utils.open_trace", autospec=True) as
           mock_open_trace):
       mock_open_trace.return_value = None
       self.mock_device.start_simpleperf_trace.return_value = mock_process
@@ -144,8 +147,8 @@ class ProfilerCommandExecutorUnitTest(unittest.TestCase):
       self.assertEqual(str(e.exception), "Gecko file was not created.")
 
   @parameterized_profiler(setup_func=setUpSubtest)
-  @mock.patch.object(subprocess, "run", autospec=True)
-  @mock.patch.object(subprocess, "Popen", autospec=True)
+  @mock.patch.object(subprocess, "run")
+  @mock.patch.object(subprocess, "Popen")
   @mock.patch.object(os.path, "exists", autospec=True)
   def test_execute_one_profiler_run_no_ui_success(self, profiler, mock_exists,
                                                   mock_process, mock_run):
@@ -262,8 +265,8 @@ class ProfilerCommandExecutorUnitTest(unittest.TestCase):
     self.assertEqual(self.mock_device.pull_file.call_count, 0)
 
   @parameterized_profiler(setup_func=setUpSubtest)
-  def test_execute_remove_file_failure(self, profiler):
-    self.mock_device.remove_file.side_effect = TEST_EXCEPTION
+  def test_execute_ensure_removed_failure(self, profiler):
+    self.mock_device.ensure_removed.side_effect = TEST_EXCEPTION
 
     with self.assertRaises(Exception) as e:
       self.executor.execute(self.command, self.mock_device)
@@ -285,7 +288,7 @@ class ProfilerCommandExecutorUnitTest(unittest.TestCase):
     self.assertEqual(self.mock_device.pull_file.call_count, 0)
 
   @parameterized_profiler(setup_func=setUpSubtest)
-  @mock.patch.object(subprocess, "Popen", autospec=True)
+  @mock.patch.object(subprocess, "Popen")
   def test_execute_process_poll_failure(self, profiler, mock_process):
     if profiler == "perfetto":
       self.mock_device.start_perfetto_trace.side_effect = TEST_EXCEPTION
@@ -300,7 +303,7 @@ class ProfilerCommandExecutorUnitTest(unittest.TestCase):
     self.assertEqual(self.mock_device.pull_file.call_count, 0)
 
   @parameterized_profiler(setup_func=setUpSubtest)
-  @mock.patch.object(subprocess, "Popen", autospec=True)
+  @mock.patch.object(subprocess, "Popen")
   def test_execute_pull_file_failure(self, profiler, mock_process):
     if profiler == "perfetto":
       self.mock_device.start_perfetto_trace.side_effect = mock_process
@@ -315,7 +318,7 @@ class ProfilerCommandExecutorUnitTest(unittest.TestCase):
     self.assertEqual(self.mock_device.pull_file.call_count, 1)
 
 
-class UserSwitchCommandExecutorUnitTest(unittest.TestCase):
+class UserSwitchCommandExecutorUnitTest(ExecutorUnitTestCase):
 
   def simulate_user_switch(self, user):
     self.current_user = user
@@ -331,23 +334,19 @@ class UserSwitchCommandExecutorUnitTest(unittest.TestCase):
     if profiler == "simpleperf":
       self.command.symbols = "/"
       self.command.scripts_path = "/"
-    self.mock_device = mock.create_autospec(AndroidDevice, instance=True)
+    self.mock_device = mock.MagicMock(spec_set=AndroidDevice)
     self.mock_device.user_exists.return_value = None
     self.mock_device.get_android_sdk_version.return_value = (
         ANDROID_SDK_VERSION_T)
     self.mock_device.get_current_user.side_effect = lambda: self.current_user
+    self.mock_device.get_user_info.side_effect = lambda: (
+        [TEST_USER_ID_1, TEST_USER_ID_2, TEST_USER_ID_3], self.current_user)
     self.mock_device.create_directory.return_value = None
     self.mock_device.id.return_value = TEST_SERIAL
-    self.mock_poll_patcher = mock.patch(
-        'src.profiler.poll_is_task_completed', return_value=True)
-    self.mock_poll_patcher.start()
-
-  def tearDown(self):
-    self.mock_poll_patcher.stop()
 
   @parameterized_profiler(setup_func=setUpSubtest)
-  @mock.patch.object(subprocess, "run", autospec=True)
-  @mock.patch.object(subprocess, "Popen", autospec=True)
+  @mock.patch.object(subprocess, "run")
+  @mock.patch.object(subprocess, "Popen")
   @mock.patch.object(os.path, "exists", autospec=True)
   def test_execute_all_users_different_success(self, profiler, mock_exists,
                                                mock_process, mock_run):
@@ -370,7 +369,7 @@ class UserSwitchCommandExecutorUnitTest(unittest.TestCase):
     self.assertEqual(self.mock_device.pull_file.call_count, 1)
 
   @parameterized_profiler(setup_func=setUpSubtest)
-  @mock.patch.object(subprocess, "Popen", autospec=True)
+  @mock.patch.object(subprocess, "Popen")
   def test_execute_perform_user_switch_failure(self, profiler, mock_process):
     self.command.from_user = TEST_USER_ID_2
     self.command.to_user = TEST_USER_ID_1
@@ -406,8 +405,8 @@ class UserSwitchCommandExecutorUnitTest(unittest.TestCase):
     self.assertEqual(self.mock_device.pull_file.call_count, 0)
 
   @parameterized_profiler(setup_func=setUpSubtest)
-  @mock.patch.object(subprocess, "run", autospec=True)
-  @mock.patch.object(subprocess, "Popen", autospec=True)
+  @mock.patch.object(subprocess, "run")
+  @mock.patch.object(subprocess, "Popen")
   @mock.patch.object(os.path, "exists", autospec=True)
   def test_execute_from_user_empty_success(self, profiler, mock_exists,
                                            mock_process, mock_run):
@@ -446,8 +445,8 @@ class UserSwitchCommandExecutorUnitTest(unittest.TestCase):
     self.assertEqual(self.mock_device.pull_file.call_count, 0)
 
   @parameterized_profiler(setup_func=setUpSubtest)
-  @mock.patch.object(subprocess, "run", autospec=True)
-  @mock.patch.object(subprocess, "Popen", autospec=True)
+  @mock.patch.object(subprocess, "run")
+  @mock.patch.object(subprocess, "Popen")
   @mock.patch.object(os.path, "exists", autospec=True)
   def test_execute_from_user_is_current_user_success(self, profiler,
                                                      mock_exists, mock_process,
@@ -471,8 +470,8 @@ class UserSwitchCommandExecutorUnitTest(unittest.TestCase):
     self.assertEqual(self.mock_device.pull_file.call_count, 1)
 
   @parameterized_profiler(setup_func=setUpSubtest)
-  @mock.patch.object(subprocess, "run", autospec=True)
-  @mock.patch.object(subprocess, "Popen", autospec=True)
+  @mock.patch.object(subprocess, "run")
+  @mock.patch.object(subprocess, "Popen")
   @mock.patch.object(os.path, "exists", autospec=True)
   def test_execute_to_user_is_current_user_success(self, profiler, mock_exists,
                                                    mock_process, mock_run):
@@ -495,7 +494,7 @@ class UserSwitchCommandExecutorUnitTest(unittest.TestCase):
     self.assertEqual(self.mock_device.pull_file.call_count, 1)
 
 
-class BootCommandExecutorUnitTest(unittest.TestCase):
+class BootCommandExecutorUnitTest(ExecutorUnitTestCase):
 
   def setUp(self):
     self.command = ProfilerCommand(PROFILER_COMMAND_TYPE, "boot", "perfetto",
@@ -504,17 +503,11 @@ class BootCommandExecutorUnitTest(unittest.TestCase):
                                    False, None, None, None, None, None, None,
                                    None, None, None, None)
     self.executor = get_executor("boot")
-    self.mock_device = mock.create_autospec(AndroidDevice, instance=True)
+    self.mock_device = mock.MagicMock(spec_set=AndroidDevice)
     self.mock_device.is_process_running.return_value = False
     self.mock_device.get_android_sdk_version.return_value = (
         ANDROID_SDK_VERSION_T)
     self.mock_device.id.return_value = TEST_SERIAL
-    self.mock_poll_patcher = mock.patch(
-        'src.profiler.poll_is_task_completed', return_value=True)
-    self.mock_poll_patcher.start()
-
-  def tearDown(self):
-    self.mock_poll_patcher.stop()
 
   def test_execute_reboot_success(self):
     error = self.executor.execute(self.command, self.mock_device)
@@ -571,8 +564,8 @@ class BootCommandExecutorUnitTest(unittest.TestCase):
     self.assertEqual(self.mock_device.reboot.call_count, 0)
     self.assertEqual(self.mock_device.pull_file.call_count, 0)
 
-  def test_execute_remove_file_failure(self):
-    self.mock_device.remove_file.side_effect = TEST_EXCEPTION
+  def test_execute_ensure_removed_failure(self):
+    self.mock_device.ensure_removed.side_effect = TEST_EXCEPTION
 
     with self.assertRaises(Exception) as e:
       self.executor.execute(self.command, self.mock_device)
@@ -622,7 +615,7 @@ class BootCommandExecutorUnitTest(unittest.TestCase):
     self.assertEqual(self.mock_device.pull_file.call_count, 0)
 
 
-class AppStartupExecutorUnitTest(unittest.TestCase):
+class AppStartupExecutorUnitTest(ExecutorUnitTestCase):
 
   def setUpSubtest(self, profiler):
     self.command = ProfilerCommand(PROFILER_COMMAND_TYPE, "app-startup",
@@ -635,7 +628,7 @@ class AppStartupExecutorUnitTest(unittest.TestCase):
     if profiler == "simpleperf":
       self.command.symbols = "/"
       self.command.scripts_path = "/"
-    self.mock_device = mock.create_autospec(AndroidDevice, instance=True)
+    self.mock_device = mock.MagicMock(spec_set=AndroidDevice)
     self.mock_device.get_packages.return_value = [
         TEST_PACKAGE_1, TEST_PACKAGE_2
     ]
@@ -644,19 +637,9 @@ class AppStartupExecutorUnitTest(unittest.TestCase):
         ANDROID_SDK_VERSION_T)
     self.mock_device.create_directory.return_value = None
     self.mock_device.id.return_value = TEST_SERIAL
-    self.mock_sleep_patcher = mock.patch.object(
-        time, 'sleep', return_value=None)
-    self.mock_sleep_patcher.start()
-    self.mock_poll_patcher = mock.patch(
-        'src.profiler.poll_is_task_completed', return_value=True)
-    self.mock_poll_patcher.start()
-
-  def tearDown(self):
-    self.mock_sleep_patcher.stop()
-    self.mock_poll_patcher.stop()
 
   @parameterized_profiler(setup_func=setUpSubtest)
-  @mock.patch.object(subprocess, "run", autospec=True)
+  @mock.patch.object(subprocess, "run")
   @mock.patch.object(os.path, "exists", autospec=True)
   def test_app_startup_command_success(self, profiler, mock_exists, mock_run):
     mock_exists.return_value = True
@@ -14,8 +14,12 @@
 # limitations under the License.
 #
 
+import os
 import subprocess
 import sys
+import time
+import unittest
+from contextlib import contextmanager
 from src.torq import create_parser, run
 from unittest import mock
 
@@ -47,6 +51,24 @@ def parameterized(items, setup_func=None):
   return decorator
 
 
+@contextmanager
+def android_serial(serial=None):
+  """
+  Sets the ANDROID_SERIAL environment variable to serial, or unsets it if
+  serial is None, and restores it afterwards. Only this variable is saved, so
+  the rest of os.environ isn't copied and cleared. Can be used as a decorator.
+  """
+  previous = os.environ.pop("ANDROID_SERIAL", None)
+  if serial is not None:
+    os.environ["ANDROID_SERIAL"] = serial
+  try:
+    yield
+  finally:
+    os.environ.pop("ANDROID_SERIAL", None)
+    if previous is not None:
+      os.environ["ANDROID_SERIAL"] = previous
+
+
 def parameterized_profiler(setup_func):
   return parameterized(["perfetto", "simpleperf"], setup_func)
 
@@ -75,19 +97,11 @@ def run_cli(command_string):
 def generate_mock_completed_process(stdout_string=b'\n',
                                     stderr_string=b'\n',
                                     returncode=0):
-
-  def check_returncode():
-    if returncode != 0:
-      raise Exception()
-
-  mock_completed_process = mock.create_autospec(
-      subprocess.CompletedProcess,
-      instance=True,
+  return subprocess.CompletedProcess(
+      args=[],
+      returncode=returncode,
       stdout=stdout_string,
-      stderr=stderr_string,
-      returncode=returncode)
-  mock_completed_process.check_returncode = check_returncode
-  return mock_completed_process
+      stderr=stderr_string)
 
 
 def generate_adb_devices_result(devices, adb_started=True):
@@ -101,3 +115,22 @@ def generate_adb_devices_result(devices, adb_started=True):
     stdout_string += b'\n'
   return subprocess.CompletedProcess(
       args=['adb', 'devices'], returncode=0, stdout=stdout_string)
+
+
+class NoSleepTestCase(unittest.TestCase):
+  """
+  Test case that patches time.sleep for the whole class, so that host-side
+  waits never slow its tests down. The patch is started once, as setup
+  functions may run once per subtest, and is stopped after the class.
+  """
+
+  @classmethod
+  def setUpClass(cls):
+    super().setUpClass()
+    cls.start_class_patch(mock.patch.object(time, "sleep", return_value=None))
+
+  @classmethod
+  def start_class_patch(cls, patcher):
+    mock_object = patcher.start()
+    cls.addClassCleanup(patcher.stop)
+    return mock_object
@@ -14,6 +14,7 @@
 # limitations under the License.
 #
 
+import io
 import unittest
 import os
 from unittest import mock
@@ -23,7 +24,7 @@ from src.profiler import (DEFAULT_DUR_MS, DEFAULT_OUT_DIR,
                           DEFAULT_TRIGGER_DUR_MS, DEFAULT_TRIGGER_MODE,
                           DEFAULT_TRIGGER_STOP_DELAY_MS, MIN_STOP_DELAY_MS,
                           MIN_DURATION_MS)
-from src.torq import verify_args
+from src.torq import TORQ_COMMANDS, verify_args
 from tests.test_utils import (create_parser_from_cli, parameterized, parse_cli,
                               parameterized_config_builder)
 
@@ -56,6 +57,14 @@ class TorqUnitTest(unittest.TestCase):
     self.assertEqual(args.dur_ms, None)
     self.assertEqual(args.between_dur_ms, DEFAULT_DUR_MS)
 
+  @mock.patch("sys.stdout", new_callable=io.StringIO)
+  def test_create_parser_help_lists_all_subcommands(self, mock_stdout):
+    with self.assertRaises(SystemExit):
+      parse_cli("torq -h")
+
+    for command in TORQ_COMMANDS:
+      self.assertIn(command, mock_stdout.getvalue())
+
   def test_create_parser_valid_event_names(self):
     args = parse_cli("torq -e custom")
 
@@ -487,6 +496,31 @@ class TorqUnitTest(unittest.TestCase):
                                         " torq --profiler simpleperf"
                                         " --simpleperf-event cpu-cycles"))
 
+  def test_verify_args_cross_argument_checks_keep_their_order(self):
+    args = parse_cli("torq -e user-switch -a %s" % TEST_PACKAGE)
+
+    args, error = verify_args(args)
+
+    self.assertEqual(error.message,
+                     "Command is invalid because --to-user is not passed.")
+
+    args = parse_cli("torq -r 0 -s cpu-cycles -s instructions")
+
+    args, error = verify_args(args)
+
+    self.assertEqual(error.message, ("Command is invalid because --runs cannot"
+                                     " be set to a value smaller than 1."))
+
+  def test_verify_args_multiple_simpleperf_events_invalid_dependencies(self):
+    args = parse_cli("torq -s cpu-cycles -s instructions")
+
+    args, error = verify_args(args)
+
+    self.assertEqual(error.suggestion, ("To capture the simpleperf event run:"
+                                        " torq --profiler simpleperf"
+                                        " --simpleperf-event cpu-cycles"
+                                        " --simpleperf-event instructions"))
+
   def test_profiler_and_perfetto_config_valid_dependency(self):
     args = parse_cli(("torq -p perfetto --perfetto-config"
                       " lightweight"))
@@ -15,17 +15,15 @@
 #
 
 import os
-import time
 import unittest
 
 from src.base import ANDROID_SDK_VERSION_T
 from src.device import AndroidDevice
 from src.profiler import PERFETTO_TRACE_FILE
-from tests.test_utils import parameterized, run_cli
+from tests.test_utils import NoSleepTestCase, parameterized, run_cli
 from unittest import mock
 from unittest.mock import ANY
 
-TEST_SERIAL = "test-serial"
 TEST_TRIGGER_NAMES = [
     "team.package.test-trigger-name", "team2.package2.test-trigger-name2"
 ]
@@ -37,9 +35,9 @@ TEST_TRIGGER_MODE = "stop"
 
 class TriggerSubcommandUnitTest(unittest.TestCase):
 
-  @mock.patch('src.torq.get_device', autospec=True)
+  @mock.patch('src.device.get_device', autospec=True)
   def test_trigger_names(self, mock_get_device):
-    mock_device = mock.create_autospec(AndroidDevice, instance=True)
+    mock_device = mock.MagicMock(spec_set=AndroidDevice)
     mock_get_device.return_value = (mock_device, None)
 
     run_cli(f"torq trigger {TEST_TRIGGER_NAMES[0]}")
@@ -47,22 +45,21 @@ class TriggerSubcommandUnitTest(unittest.TestCase):
     mock_device.trigger_perfetto.assert_called_with(TEST_TRIGGER_NAMES[0])
 
 
-class ProfilerTriggerUnitTest(unittest.TestCase):
+class ProfilerTriggerUnitTest(NoSleepTestCase):
 
   def setUp(self):
-    self.mock_device = mock.create_autospec(
-        AndroidDevice, instance=True, serial=TEST_SERIAL)
+    self.mock_device = mock.MagicMock(spec_set=AndroidDevice)
     self.mock_device.get_android_sdk_version.return_value = (
         ANDROID_SDK_VERSION_T)
     self.mock_device.create_directory.return_value = None
-    self.mock_device.remove_file.return_value = False
+    self.mock_device.ensure_removed.return_value = False
     self.mock_device.pull_file.return_value = False
-    self.mock_sleep_patcher = mock.patch.object(
-        time, 'sleep', return_value=None)
-    self.mock_sleep_patcher.start()
+    self.get_device_patcher = mock.patch('src.device.get_device', autospec=True)
+    self.mock_get_device = self.get_device_patcher.start()
+    self.mock_get_device.return_value = (self.mock_device, None)
 
   def tearDown(self):
-    self.mock_sleep_patcher.stop()
+    self.get_device_patcher.stop()
 
   @parameterized([""] + [
       f"--trigger-stop-delay-ms {delays}" for delays in [
@@ -70,11 +67,8 @@ class ProfilerTriggerUnitTest(unittest.TestCase):
               TEST_MULTIPLE_TRIGGER_STOP_DELAY_MS)
       ]
   ] + [f"--trigger-mode {mode}" for mode in ["start", "clone", "stop"]])
-  @mock.patch('src.torq.get_device', autospec=True)
-  def test_trigger_names(self, trigger_args, mock_get_device):
-    mock_get_device.return_value = (self.mock_device, None)
-
-    with (mock.patch("src.profiler.open_trace", autospec=True) as
+  def test_trigger_names(self, trigger_args):
+    with (mock.patch("src.open_ui_utils.open_trace", autospec=True) as
           mock_open_trace):
       mock_open_trace.return_value = None
       run_cli(
@@ -85,18 +79,15 @@ class ProfilerTriggerUnitTest(unittest.TestCase):
 
     self.mock_device.start_perfetto_trace.assert_called()
 
-  @mock.patch('src.torq.get_device', autospec=True)
-  def test_trigger_names_incorrect_stop_delays(self, mock_get_device):
-    mock_get_device.return_value = (self.mock_device, None)
-
-    with (mock.patch("src.profiler.open_trace", autospec=True) as
+  def test_trigger_names_incorrect_stop_delays(self):
+    with (mock.patch("src.open_ui_utils.open_trace", autospec=True) as
           mock_open_trace):
       mock_open_trace.return_value = None
       run_cli(f"torq --trigger-names {' '.join(TEST_TRIGGER_NAMES)}"
               f" --trigger-stop-delay-ms"
               f" {' '.join(TEST_MULTIPLE_TRIGGER_STOP_DELAY_MS)} 3000")
 
-    mock_get_device.assert_not_called()
+    self.mock_get_device.assert_not_called()
 
     self.mock_device.pull_file.assert_not_called()
 
@@ -25,7 +25,7 @@ from tests.test_utils import create_parser_from_cli, generate_mock_completed_pro
 
 class UtilsUnitTest(unittest.TestCase):
 
-  @mock.patch.object(subprocess, "run", autospec=True)
+  @mock.patch.object(subprocess, "run")
   @mock.patch.object(os.path, "exists", autospec=True)
   def test_convert_simpleperf_to_gecko_success(self, mock_exists,
                                                mock_subprocess_run):
@@ -36,7 +36,7 @@ class UtilsUnitTest(unittest.TestCase):
     convert_simpleperf_to_gecko("/scripts", "/path/file.data",
                                 "/path/file.json", "/symbols")
 
-  @mock.patch.object(subprocess, "run", autospec=True)
+  @mock.patch.object(subprocess, "run")
   @mock.patch.object(os.path, "exists", autospec=True)
   def test_convert_simpleperf_to_gecko_failure(self, mock_exists,
                                                mock_subprocess_run):
@@ -138,7 +138,7 @@ class ValidateSimpleperfUnitTest(unittest.TestCase):
       os.environ, {"ANDROID_PRODUCT_OUT": ANDROID_PRODUCT_OUT}, clear=True)
   @mock.patch.object(os.path, "exists", autospec=True)
   @mock.patch.object(os.path, "isdir", autospec=True)
-  @mock.patch.object(subprocess, "run", autospec=True)
+  @mock.patch.object(subprocess, "run")
   @mock.patch.object(builtins, "input")
   def test_create_parser_successfully_download_scripts(self, mock_input,
                                                        mock_subprocess_run,
@@ -159,7 +159,7 @@ class ValidateSimpleperfUnitTest(unittest.TestCase):
       os.environ, {"ANDROID_BUILD_TOP": ANDROID_BUILD_TOP}, clear=True)
   @mock.patch.object(os.path, "exists", autospec=True)
   @mock.patch.object(os.path, "isdir", autospec=True)
-  @mock.patch.object(subprocess, "run", autospec=True)
+  @mock.patch.object(subprocess, "run")
   @mock.patch.object(builtins, "input")
   def test_create_parser_failed_to_download_scripts(self, mock_input,
                                                     mock_subprocess_run,
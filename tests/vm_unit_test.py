@@ -18,7 +18,7 @@ import io
 import unittest
 from contextlib import redirect_stderr
 from src.device import AndroidDevice
-from src.vm import (DEFAULT_IP_ADDR, TRACED_ENABLE_PROP,
+from src.vm import (DEFAULT_IP_ADDR, TRACED_ENABLE_PROP, TRACED_HYPERVISOR_PROP,
                     TRACED_MACHINE_NAME_PROP, TRACED_RELAY_PORT_PROP,
                     TRACED_RELAY_PRODUCER_PORT_PROP, DEFAULT_VSOCK_ADDR)
 from tests.test_utils import run_cli
@@ -29,82 +29,82 @@ TEST_SERIAL = "test-serial"
 
 class VmUnitTest(unittest.TestCase):
 
+  @classmethod
+  def setUpClass(cls):
+    # Autospeccing AndroidDevice is slow, so the mock is built once and reset
+    # before each test.
+    cls.device_template = mock.create_autospec(AndroidDevice, instance=True)
+
   def setUp(self):
-    self.mock_device = mock.create_autospec(AndroidDevice, instance=True)
+    self.mock_device = self.device_template
+    self.mock_device.reset_mock(return_value=True, side_effect=True)
+    self.get_device_patcher = mock.patch('src.vm.get_device', autospec=True)
+    self.mock_get_device = self.get_device_patcher.start()
+    self.mock_get_device.return_value = (self.mock_device, None)
 
   def tearDown(self):
+    self.get_device_patcher.stop()
     self.mock_device = None
 
-  @mock.patch('src.vm.get_device', autospec=True)
-  def test_set_primary(self, mock_get_device):
-    mock_get_device.return_value = (self.mock_device, None)
-
+  def test_set_primary(self):
     run_cli(f"torq vm configure --primary {TEST_SERIAL}")
 
-    mock_get_device.assert_called_once_with(TEST_SERIAL, True)
-
-    self.mock_device.set_prop.assert_any_call(TRACED_RELAY_PRODUCER_PORT_PROP,
-                                              DEFAULT_VSOCK_ADDR)
-    # Assert the last call
-    self.mock_device.set_prop.assert_called_with(TRACED_ENABLE_PROP, "1")
+    self.mock_get_device.assert_called_once_with(TEST_SERIAL, True)
+    self.mock_device.close.assert_called_once()
 
-  @mock.patch('src.vm.get_device', autospec=True)
-  def test_set_primary_with_machine_name(self, mock_get_device):
-    mock_get_device.return_value = (self.mock_device, None)
+    self.mock_device.set_props.assert_called_once_with([
+        (TRACED_ENABLE_PROP, "0"),
+        (TRACED_RELAY_PRODUCER_PORT_PROP, DEFAULT_VSOCK_ADDR),
+        (TRACED_ENABLE_PROP, "1")
+    ])
 
+  def test_set_primary_with_machine_name(self):
     run_cli(f"torq vm configure --primary machine_name={TEST_SERIAL}")
 
-    mock_get_device.assert_called_once_with(TEST_SERIAL, True)
+    self.mock_get_device.assert_called_once_with(TEST_SERIAL, True)
 
-    self.mock_device.set_prop.assert_any_call(TRACED_MACHINE_NAME_PROP,
-                                              "machine_name")
-    self.mock_device.set_prop.assert_any_call(TRACED_RELAY_PRODUCER_PORT_PROP,
-                                              DEFAULT_VSOCK_ADDR)
-    # Assert the last call
-    self.mock_device.set_prop.assert_called_with(TRACED_ENABLE_PROP, "1")
-
-  @mock.patch('src.vm.get_device', autospec=True)
-  def test_set_primary_with_tcp(self, mock_get_device):
-    mock_get_device.return_value = (self.mock_device, None)
+    self.mock_device.set_props.assert_called_once_with([
+        (TRACED_ENABLE_PROP, "0"), (TRACED_MACHINE_NAME_PROP, "machine_name"),
+        (TRACED_RELAY_PRODUCER_PORT_PROP, DEFAULT_VSOCK_ADDR),
+        (TRACED_ENABLE_PROP, "1")
+    ])
 
+  def test_set_primary_with_tcp(self):
     run_cli(f"torq vm configure --primary {TEST_SERIAL} --primary-ip 0.0.0.2")
 
-    mock_get_device.assert_called_once_with(TEST_SERIAL, True)
-
-    self.mock_device.set_prop.assert_any_call(TRACED_RELAY_PRODUCER_PORT_PROP,
-                                              DEFAULT_IP_ADDR)
-    # Assert the last call
-    self.mock_device.set_prop.assert_called_with(TRACED_ENABLE_PROP, "1")
+    self.mock_get_device.assert_called_once_with(TEST_SERIAL, True)
 
-  @mock.patch('src.vm.get_device', autospec=True)
-  def test_set_primary_with_custom_vsock_addr(self, mock_get_device):
-    mock_get_device.return_value = (self.mock_device, None)
+    self.mock_device.set_props.assert_called_once_with([
+        (TRACED_ENABLE_PROP, "0"),
+        (TRACED_RELAY_PRODUCER_PORT_PROP, DEFAULT_IP_ADDR),
+        (TRACED_ENABLE_PROP, "1")
+    ])
 
+  def test_set_primary_with_custom_vsock_addr(self):
     run_cli(
         f"torq vm configure --primary {TEST_SERIAL} --primary-addr vsock://5:4000"
     )
 
-    mock_get_device.assert_called_once_with(TEST_SERIAL, True)
+    self.mock_get_device.assert_called_once_with(TEST_SERIAL, True)
 
-    self.mock_device.set_prop.assert_any_call(TRACED_RELAY_PRODUCER_PORT_PROP,
-                                              "vsock://-1:4000")
-    # Assert the last call
-    self.mock_device.set_prop.assert_called_with(TRACED_ENABLE_PROP, "1")
-
-  @mock.patch('src.vm.get_device', autospec=True)
-  def test_set_primary_with_custom_tcp_addr(self, mock_get_device):
-    mock_get_device.return_value = (self.mock_device, None)
+    self.mock_device.set_props.assert_called_once_with([
+        (TRACED_ENABLE_PROP, "0"),
+        (TRACED_RELAY_PRODUCER_PORT_PROP, "vsock://-1:4000"),
+        (TRACED_ENABLE_PROP, "1")
+    ])
 
+  def test_set_primary_with_custom_tcp_addr(self):
     run_cli(
         f"torq vm configure --primary {TEST_SERIAL} --primary-addr 0.0.0.1:4000"
     )
 
-    mock_get_device.assert_called_once_with(TEST_SERIAL, True)
+    self.mock_get_device.assert_called_once_with(TEST_SERIAL, True)
 
-    self.mock_device.set_prop.assert_any_call(TRACED_RELAY_PRODUCER_PORT_PROP,
-                                              "0.0.0.0:4000")
-    # Assert the last call
-    self.mock_device.set_prop.assert_called_with(TRACED_ENABLE_PROP, "1")
+    self.mock_device.set_props.assert_called_once_with([
+        (TRACED_ENABLE_PROP, "0"),
+        (TRACED_RELAY_PRODUCER_PORT_PROP, "0.0.0.0:4000"),
+        (TRACED_ENABLE_PROP, "1")
+    ])
 
   def test_primary_with_incorrect_name_format(self):
     tmp_stderr = io.StringIO()
@@ -151,48 +151,38 @@ class VmUnitTest(unittest.TestCase):
     output = tmp_stderr.getvalue()
     self.assertIn("--primary can only be specified once", output)
 
-  @mock.patch('src.vm.get_device', autospec=True)
-  def test_set_secondary(self, mock_get_device):
-    mock_get_device.return_value = (self.mock_device, None)
-
+  def test_set_secondary(self):
     run_cli(f"torq vm configure --primary-cid 4 --secondary {TEST_SERIAL}")
 
-    mock_get_device.assert_called_once_with(TEST_SERIAL, True)
-
-    self.mock_device.set_prop.assert_any_call(TRACED_RELAY_PORT_PROP,
-                                              "vsock://4:30001")
-    # Assert the last call
-    self.mock_device.set_prop.assert_called_with(TRACED_ENABLE_PROP, "2")
+    self.mock_get_device.assert_called_once_with(TEST_SERIAL, True)
 
-  @mock.patch('src.vm.get_device', autospec=True)
-  def test_set_secondary_with_machine_name(self, mock_get_device):
-    mock_get_device.return_value = (self.mock_device, None)
+    self.mock_device.set_props.assert_called_once_with([
+        (TRACED_HYPERVISOR_PROP, "true"),
+        (TRACED_RELAY_PORT_PROP, "vsock://4:30001"), (TRACED_ENABLE_PROP, "2")
+    ])
 
+  def test_set_secondary_with_machine_name(self):
     run_cli(
         f"torq vm configure --primary-cid 4 --secondary guest_name={TEST_SERIAL}"
     )
 
-    mock_get_device.assert_called_once_with(TEST_SERIAL, True)
+    self.mock_get_device.assert_called_once_with(TEST_SERIAL, True)
 
-    self.mock_device.set_prop.assert_any_call(TRACED_MACHINE_NAME_PROP,
-                                              "guest_name")
-    self.mock_device.set_prop.assert_any_call(TRACED_RELAY_PORT_PROP,
-                                              "vsock://4:30001")
-    # Assert the last call
-    self.mock_device.set_prop.assert_called_with(TRACED_ENABLE_PROP, "2")
-
-  @mock.patch('src.vm.get_device', autospec=True)
-  def test_set_secondary_with_ip(self, mock_get_device):
-    mock_get_device.return_value = (self.mock_device, None)
+    self.mock_device.set_props.assert_called_once_with([
+        (TRACED_MACHINE_NAME_PROP, "guest_name"),
+        (TRACED_HYPERVISOR_PROP, "true"),
+        (TRACED_RELAY_PORT_PROP, "vsock://4:30001"), (TRACED_ENABLE_PROP, "2")
+    ])
 
+  def test_set_secondary_with_ip(self):
     run_cli(f"torq vm configure --primary-ip 0.0.0.0 --secondary {TEST_SERIAL}")
 
-    mock_get_device.assert_called_once_with(TEST_SERIAL, True)
+    self.mock_get_device.assert_called_once_with(TEST_SERIAL, True)
 
-    self.mock_device.set_prop.assert_any_call(TRACED_RELAY_PORT_PROP,
-                                              "0.0.0.0:30001")
-    # Assert the last call
-    self.mock_device.set_prop.assert_called_with(TRACED_ENABLE_PROP, "2")
+    self.mock_device.set_props.assert_called_once_with([
+        (TRACED_HYPERVISOR_PROP, "true"),
+        (TRACED_RELAY_PORT_PROP, "0.0.0.0:30001"), (TRACED_ENABLE_PROP, "2")
+    ])
 
   def test_multiple_secondary_without_primary_address(self):
     tmp_stderr = io.StringIO()
@@ -233,28 +223,30 @@ class VmUnitTest(unittest.TestCase):
     output = tmp_stderr.getvalue()
     self.assertIn("--primary-addr can only be specified once", output)
 
-  @mock.patch('src.vm.get_device', autospec=True)
-  def test_set_multiple_machines(self, mock_get_device):
-    mock_get_device.return_value = (self.mock_device, None)
-
+  def test_set_multiple_machines(self):
     run_cli(f"torq vm configure --primary-cid 4 --primary main={TEST_SERIAL} "
             "--secondary guest=test-serial2")
 
-    self.assertEqual(mock_get_device.call_count, 2)
-    mock_get_device.assert_any_call(TEST_SERIAL, True)
-    mock_get_device.assert_any_call("test-serial2", True)
-
-    # Assert the primary machine
-    self.mock_device.set_prop.assert_any_call(TRACED_MACHINE_NAME_PROP, "main")
-    self.mock_device.set_prop.assert_any_call(TRACED_RELAY_PRODUCER_PORT_PROP,
-                                              "vsock://-1:30001")
-
-    # Assert the secondary machine
-    self.mock_device.set_prop.assert_any_call(TRACED_MACHINE_NAME_PROP, "guest")
-    self.mock_device.set_prop.assert_any_call(TRACED_RELAY_PORT_PROP,
-                                              "vsock://4:30001")
-    # Assert the last call
-    self.mock_device.set_prop.assert_called_with(TRACED_ENABLE_PROP, "2")
+    self.assertEqual(
+        self.mock_get_device.call_args_list,
+        [mock.call(TEST_SERIAL, True),
+         mock.call("test-serial2", True)])
+
+    self.assertEqual(
+        self.mock_device.set_props.call_args_list,
+        [
+            # The primary machine
+            mock.call([(TRACED_ENABLE_PROP, "0"),
+                       (TRACED_MACHINE_NAME_PROP, "main"),
+                       (TRACED_RELAY_PRODUCER_PORT_PROP, "vsock://-1:30001"),
+                       (TRACED_ENABLE_PROP, "1")]),
+            # The secondary machine
+            mock.call([(TRACED_MACHINE_NAME_PROP, "guest"),
+                       (TRACED_HYPERVISOR_PROP, "true"),
+                       (TRACED_RELAY_PORT_PROP, "vsock://4:30001"),
+                       (TRACED_ENABLE_PROP, "2")])
+        ])
+    self.assertEqual(self.mock_device.close.call_count, 2)
 
 
 if __name__ == "__main__":